@@ -0,0 +1,396 @@
+"""Benchmarks for the Audify server with local stand-ins for the upstreams.
+
+A fake yt-dlp returns canned info dicts, a local HTTP server serves the audio
+bytes (Range support, configurable latency and bandwidth) and a fake spotdl
+writes canned playlists. The Flask app runs on a local threaded server and
+is driven by concurrent clients.
+
+    python benchmark.py
+    python benchmark.py --clients 16 --latency-ms 80 --only search,proxy
+    python benchmark.py --json after.json --baseline before.json
+
+Each scenario reports p50/p95/p99 latency, requests and bytes per second and
+the process RSS afterwards (server and clients share the process).
+"""
+import argparse
+import atexit
+import concurrent.futures
+import http.server
+import json
+import logging
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+# Signed stream URLs carry an expiry; keep the fake ones valid for a day
+URL_LIFETIME = 24 * 3600
+SEEK_RANGE_BYTES = 64 * 1024
+UPSTREAM_CHUNK_SIZE = 16 * 1024
+
+SCENARIOS = ('search', 'resolve', 'batch', 'proxy', 'seek', 'playlist', 'import')
+
+
+class FakeUpstream:
+    """Local HTTP server standing in for the audio CDN"""
+    def __init__(self, track_bytes, latency, bandwidth):
+        self.data = bytes(range(256)) * (track_bytes // 256)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def _handler(self):
+        upstream = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                time.sleep(upstream.latency)
+                data = upstream.data
+                match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+                if match:
+                    start = int(match.group(1))
+                    end = min(int(match.group(2)) if match.group(2) else len(data) - 1, len(data) - 1)
+                    if start >= len(data):
+                        self.send_response(416)
+                        self.send_header('Content-Range', f'bytes */{len(data)}')
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+                else:
+                    start, end = 0, len(data) - 1
+                    self.send_response(200)
+                self.send_header('Content-Type', 'audio/mp4')
+                self.send_header('Content-Length', str(end - start + 1))
+                self.send_header('Accept-Ranges', 'bytes')
+                self.end_headers()
+                upstream.write(self.wfile, data[start:end + 1])
+
+        return Handler
+
+    def write(self, out, body):
+        for offset in range(0, len(body), UPSTREAM_CHUNK_SIZE):
+            chunk = body[offset:offset + UPSTREAM_CHUNK_SIZE]
+            try:
+                out.write(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            if self.bandwidth:
+                time.sleep(len(chunk) / self.bandwidth)
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+
+
+def make_fake_yt_dlp(upstream_url, latency, results=25):
+    """Module-shaped stand-in for yt_dlp returning canned info dicts"""
+    class DownloadCancelled(Exception):
+        pass
+
+    def entry(video_id):
+        return {
+            'id': video_id,
+            'title': f'Track {video_id}',
+            'uploader': 'Benchmark Artist',
+            'duration': 180,
+            'thumbnails': [{'url': '/static/default-thumbnail.png'}],
+        }
+
+    class FakeYoutubeDL:
+        def __init__(self, opts=None):
+            self.opts = opts or {}
+
+        def extract_info(self, url, download=False):
+            time.sleep(latency)
+            search = re.match(r'ytsearch(\d*):(.*)', url)
+            if search:
+                count = int(search.group(1) or 1)
+                slug = re.sub(r'\W+', '', search.group(2))[:20]
+                return {'entries': [entry(f'{slug}{i}') for i in range(count)]}
+
+            video_id = parse_qs(urlparse(url).query).get('v', ['unknown'])[0]
+            if '&list=RD' in url:
+                return {'entries': [entry(video_id)] + [entry(f'{video_id}r{i}') for i in range(results)]}
+            expire = int(time.time()) + URL_LIFETIME
+            return {
+                **entry(video_id),
+                'thumbnail': '',
+                'formats': [{
+                    'format_id': '140',
+                    'ext': 'm4a',
+                    'acodec': 'mp4a.40.2',
+                    'abr': 128,
+                    'url': f'{upstream_url}/videoplayback/{video_id}?expire={expire}',
+                    'http_headers': {},
+                }],
+            }
+
+        def close(self):
+            pass
+
+    return types.SimpleNamespace(
+        YoutubeDL=FakeYoutubeDL,
+        utils=types.SimpleNamespace(DownloadCancelled=DownloadCancelled)
+    )
+
+
+class FakeSubprocess:
+    """subprocess stand-in that answers 'spotdl save' with a canned playlist
+    and passes every other command through"""
+    def __init__(self, songs):
+        self.songs = songs
+
+    def run(self, cmd, *args, **kwargs):
+        if list(cmd[:2]) == ['spotdl', 'save']:
+            playlist = cmd[2].rstrip('/').rsplit('/', 1)[-1]
+            save_file = cmd[cmd.index('--save-file') + 1]
+            with open(save_file, 'w', encoding='utf-8') as f:
+                json.dump([
+                    {'name': f'Song {i} of {playlist}', 'artist': 'Benchmark Artist'}
+                    for i in range(self.songs)
+                ], f)
+            return subprocess.CompletedProcess(cmd, 0, '', '')
+        return subprocess.run(cmd, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(subprocess, name)
+
+
+def rss_mb():
+    """Resident set size of this process in MiB, or None if unavailable"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 2 ** 20
+    except ImportError:
+        return None
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_scenario(name, call, requests_count, clients):
+    """Run call(session, i) requests_count times on 'clients' threads. call
+    returns the number of body bytes it read."""
+    local = threading.local()
+    latencies = []
+    errors = []
+    total_bytes = 0
+    lock = threading.Lock()
+
+    def task(i):
+        nonlocal total_bytes
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            read = call(session, i)
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+            return
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            total_bytes += read
+
+    started = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=clients) as executor:
+        list(executor.map(task, range(requests_count)))
+    wall = time.perf_counter() - started
+
+    return {
+        'scenario': name,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+        'p50_ms': _ms(percentile(latencies, 0.50)),
+        'p95_ms': _ms(percentile(latencies, 0.95)),
+        'p99_ms': _ms(percentile(latencies, 0.99)),
+        'requests_per_s': round(len(latencies) / wall, 1) if wall else None,
+        'mb_per_s': round(total_bytes / wall / 2 ** 20, 2) if wall else None,
+        'rss_mb': round(rss_mb(), 1) if rss_mb() is not None else None,
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+def checked(response):
+    response.raise_for_status()
+    return response
+
+
+def build_scenarios(base, args):
+    distinct = max(1, args.distinct)
+    seek_random = random.Random(args.seed)
+    track_bytes = args.track_kb * 1024
+
+    def search(session, i):
+        response = checked(session.get(f'{base}/api/search', params={'q': f'query {i % distinct}', 'limit': 10}))
+        return len(response.content)
+
+    def resolve(session, i):
+        return len(checked(session.get(f'{base}/api/stream/resolve{i % distinct}')).content)
+
+    def batch(session, i):
+        # One playlist-sized resolution per request; ids overlap across requests
+        ids = [f'batch{(i + n) % (distinct * 2)}' for n in range(distinct)]
+        response = checked(session.post(f'{base}/api/stream/batch', json={'ids': ids}))
+        return len(response.content)
+
+    def proxy(session, i):
+        read = 0
+        with checked(session.get(f'{base}/api/proxy/proxy{i % distinct}', stream=True)) as response:
+            for chunk in response.iter_content(64 * 1024):
+                read += len(chunk)
+        return read
+
+    def seek(session, i):
+        start = seek_random.randrange(0, max(1, track_bytes - SEEK_RANGE_BYTES))
+        headers = {'Range': f'bytes={start}-{start + SEEK_RANGE_BYTES - 1}'}
+        return len(checked(session.get(f'{base}/api/proxy/seek{i % distinct}', headers=headers)).content)
+
+    def playlist(session, i):
+        created = checked(session.post(f'{base}/api/playlists', json={'name': f'Benchmark {i}'})).json()
+        playlist_id = created['id']
+        for n in range(10):
+            checked(session.post(f'{base}/api/playlists/{playlist_id}/songs', json={
+                'id': f'song{i}_{n}', 'title': f'Song {n}', 'uploader': 'Benchmark Artist',
+                'thumbnails': [{'url': '/static/default-thumbnail.png'}]
+            }))
+        checked(session.delete(f'{base}/api/playlists/{playlist_id}/songs', params={'song_id': f'song{i}_0'}))
+        checked(session.delete(f'{base}/api/playlists/{playlist_id}'))
+        return 0
+
+    def spotify_import(session, i):
+        response = checked(session.post(f'{base}/api/playlists/import', json={
+            'spotifyUrl': f'https://open.spotify.com/playlist/bench{i}'
+        }))
+        return len(response.content)
+
+    return {
+        'search': (search, args.requests),
+        'resolve': (resolve, args.requests),
+        'batch': (batch, max(1, args.requests // 10)),
+        'proxy': (proxy, max(1, args.requests // 4)),
+        'seek': (seek, args.requests),
+        'playlist': (playlist, max(1, args.requests // 10)),
+        'import': (spotify_import, max(1, args.requests // 20)),
+    }
+
+
+def print_table(results, baseline=None):
+    columns = ('scenario', 'requests', 'errors', 'p50_ms', 'p95_ms', 'p99_ms',
+               'requests_per_s', 'mb_per_s', 'rss_mb')
+    print(' '.join(f'{c:>14}' for c in columns))
+    for result in results:
+        print(' '.join(f'{str(result[c]):>14}' for c in columns))
+        if result['first_error']:
+            print(f'{"":>14} first error: {result["first_error"]}')
+        previous = (baseline or {}).get(result['scenario'])
+        if previous:
+            changes = []
+            for key in ('p95_ms', 'requests_per_s'):
+                if previous.get(key) and result.get(key) is not None:
+                    changes.append(f'{key} {100 * (result[key] - previous[key]) / previous[key]:+.1f}%')
+            print(f'{"":>14} vs baseline: {", ".join(changes)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--clients', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario (fewer for proxy, playlist, import)')
+    parser.add_argument('--distinct', type=int, default=20, help='distinct queries/videos per scenario; repeats hit the caches')
+    parser.add_argument('--latency-ms', type=float, default=50, help='upstream time to first byte')
+    parser.add_argument('--bandwidth-kb', type=float, default=0, help='upstream KiB/s per connection (0 = unlimited)')
+    parser.add_argument('--extract-ms', type=float, default=100, help='fake yt-dlp extraction time')
+    parser.add_argument('--track-kb', type=int, default=4096, help='size of the served audio file')
+    parser.add_argument('--import-songs', type=int, default=25, help='songs per fake Spotify playlist')
+    parser.add_argument('--only', help=f'comma-separated subset of {",".join(SCENARIOS)}')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--baseline', help='earlier --json output to compare against')
+    args = parser.parse_args()
+
+    selected = args.only.split(',') if args.only else list(SCENARIOS)
+    unknown = set(selected) - set(SCENARIOS)
+    if unknown:
+        parser.error(f'unknown scenarios: {", ".join(sorted(unknown))}')
+
+    # The app keeps its library, database and caches here instead of the user's
+    data_dir = tempfile.mkdtemp(prefix='audify_bench_')
+    os.environ['AUDIFY_DATA_DIR'] = data_dir
+    # Registered before the app's own exit hooks so it runs after them
+    atexit.register(shutil.rmtree, data_dir, ignore_errors=True)
+    os.environ.setdefault('AUDIFY_QUERY_CACHE_PERSIST', '0')
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    upstream = FakeUpstream(args.track_kb * 1024, args.latency_ms / 1000, args.bandwidth_kb * 1024)
+    upstream.start()
+
+    import main as audify
+    from werkzeug.serving import make_server
+
+    audify.yt_dlp = make_fake_yt_dlp(upstream.url, args.extract_ms / 1000)
+    audify.subprocess = FakeSubprocess(args.import_songs)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    server = make_server('127.0.0.1', 0, audify.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_port}'
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {result['scenario']: result for result in json.load(f)['results']}
+
+    scenarios = build_scenarios(base, args)
+    results = []
+    try:
+        for name in selected:
+            call, count = scenarios[name]
+            results.append(run_scenario(name, call, count, args.clients))
+    finally:
+        server.shutdown()
+        upstream.stop()
+
+    print_table(results, baseline)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,31 +1,192 @@
 from flask import Flask, render_template, jsonify, send_file, request, Response, stream_with_context
 from flask_cors import CORS
-import yt_dlp
 import threading
 import json
 import os
 from urllib.parse import quote
 import requests
 import sys
-import winreg
 import time
-import pygame
 import webbrowser
 import random
 import uuid
 import subprocess
 import tempfile
 import re
-from urllib.parse import urlparse
+from urllib.parse import urlparse, parse_qs
 import logging
 from datetime import datetime
+from contextlib import contextmanager
+from collections import OrderedDict, deque
+import atexit
+import math
+import sqlite3
+import queue
+import itertools
+import asyncio
+import bisect
+import functools
+import hashlib
+import mimetypes
+import mmap
+import struct
+import concurrent.futures
+import importlib.util
+import hmac
+import ipaddress
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import safe_join
 
 # Initialize Flask app
 app = Flask(__name__)
 CORS(app)
 
 # Global variables
-download_progress = {}
+# Number of search queries kept in history
+SEARCH_HISTORY_LIMIT = 20
+
+# Background download workers and how many finished jobs are remembered
+DOWNLOAD_WORKERS = int(os.environ.get('AUDIFY_DOWNLOAD_WORKERS', 2))
+FINISHED_JOBS_KEPT = 200
+
+# Directory listings are re-checked at most this often (a stat of the
+# directory), with a full rescan to catch in-place file changes
+LIBRARY_CHECK_INTERVAL = 1
+LIBRARY_RESCAN_INTERVAL = 60
+
+# Local audio files: how long browsers may reuse them without asking, and
+# optional hand-off of the file body to a reverse proxy ('x-sendfile' for
+# Apache/lighttpd, 'x-accel' for nginx, with the internal location prefix)
+LOCAL_FILE_MAX_AGE = int(os.environ.get('AUDIFY_LOCAL_MAX_AGE', 3600))
+LOCAL_FILE_OFFLOAD = os.environ.get('AUDIFY_FILE_OFFLOAD', '')
+LOCAL_ACCEL_PREFIX = os.environ.get('AUDIFY_ACCEL_PREFIX', '/protected-downloads/')
+# Audio types the platform mimetypes table may not know or may map to video
+LOCAL_AUDIO_TYPES = {'.opus': 'audio/ogg', '.m4a': 'audio/mp4', '.webm': 'audio/webm'}
+
+# Download profiles: 'original' keeps the downloaded audio as-is (no
+# ffmpeg), 'mp3' re-encodes, 'opus' prefers Opus sources so ffmpeg only
+# copies the stream out of its container
+DOWNLOAD_PROFILES = {
+    'original': {'format': 'bestaudio[ext=m4a]/bestaudio/best', 'codec': None},
+    'mp3': {'format': 'bestaudio/best', 'codec': 'mp3'},
+    'opus': {'format': 'bestaudio[acodec=opus]/bestaudio/best', 'codec': 'opus'},
+}
+DOWNLOAD_PROFILE = os.environ.get('AUDIFY_DOWNLOAD_PROFILE', 'mp3')
+if DOWNLOAD_PROFILE not in DOWNLOAD_PROFILES:
+    raise ValueError(f"AUDIFY_DOWNLOAD_PROFILE must be one of {sorted(DOWNLOAD_PROFILES)}, "
+                     f"not {DOWNLOAD_PROFILE!r}")
+# yt-dlp audio quality for mp3/opus: 0-9 is VBR quality, larger is kbit/s
+DOWNLOAD_AUDIO_QUALITY = os.environ.get('AUDIFY_AUDIO_QUALITY', '5')
+
+# Opt-in slow request profiling: requests slower than this many ms keep a
+# sampled stack profile (0 disables sampling), the sampling period in
+# seconds, how many profiles are kept, and a token for the admin
+# endpoints (X-Admin-Token header); without it they only answer loopback clients
+PROFILE_SLOW_MS = int(os.environ.get('AUDIFY_PROFILE_SLOW_MS', 0))
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get('AUDIFY_PROFILE_INTERVAL', 0.005))
+PROFILES_KEPT = 50
+ADMIN_TOKEN = os.environ.get('AUDIFY_ADMIN_TOKEN', '')
+
+# Search and related results cache: lifetimes in seconds, entries per kind,
+# and whether entries are mirrored to the database
+SEARCH_CACHE_TTL = int(os.environ.get('AUDIFY_SEARCH_CACHE_TTL', 6 * 3600))
+RELATED_CACHE_TTL = int(os.environ.get('AUDIFY_RELATED_CACHE_TTL', 12 * 3600))
+QUERY_CACHE_SIZE = int(os.environ.get('AUDIFY_QUERY_CACHE_SIZE', 512))
+QUERY_CACHE_PERSIST = os.environ.get('AUDIFY_QUERY_CACHE_PERSIST', '1') == '1'
+
+# Title decorations ignored when de-duplicating related tracks
+TITLE_DECORATION_PATTERN = re.compile(
+    r'[\(\[][^\)\]]*\b(official|video|audio|lyrics?|visuali[sz]er|hd|hq|4k|remaster(ed)?|mv|explicit)\b[^\)\]]*[\)\]]'
+)
+# Only at the end of a title and after a separator, so words such as
+# 'lyrics' elsewhere in a title are kept
+TITLE_SUFFIX_PATTERN = re.compile(
+    r'[\s\-\u2013\u2014|:]+(official (music |lyric )?(video|audio)|lyric video|with lyrics|lyrics)\s*$'
+)
+
+# Recommendation ranking: how much each signal counts towards a seed track,
+# how often the ranked list is rebuilt, and how many new seeds have their
+# related tracks fetched per rebuild
+RECOMMENDATION_WEIGHTS = {'download': 3.0, 'playlist': 2.0, 'play': 1.0, 'search': 0.5}
+RECOMMENDATION_REFRESH_INTERVAL = 600
+RECOMMENDATION_EXPANSIONS = 5
+RECOMMENDATION_LIMIT = 100
+# A seed whose related tracks could not be fetched is retried after this
+# many seconds, doubling per failed attempt up to the maximum
+RECOMMENDATION_RETRY_DELAY = 3600
+RECOMMENDATION_RETRY_MAX_DELAY = 7 * 24 * 3600
+
+# Largest page /api/search will return
+SEARCH_MAX_LIMIT = 50
+# Deepest result /api/search pages into; yt-dlp extracts every entry up to
+# offset + limit for each page
+SEARCH_MAX_DEPTH = 200
+
+# Concurrent YouTube searches while resolving a Spotify import
+IMPORT_WORKERS = int(os.environ.get('AUDIFY_IMPORT_WORKERS', 4))
+
+# Seconds between keep-alive comments on idle event streams
+SSE_HEARTBEAT = 15
+# How long a download progress stream waits for a job to appear for a
+# track nobody has queued before it gives up
+DOWNLOAD_PROGRESS_WAIT = 60
+
+# Serving mode: 'threaded' (Flask development server) or 'asgi' (uvicorn
+# with an event-loop proxy); the latter needs uvicorn, httpx and a2wsgi,
+# listed in requirements-asgi.txt
+SERVER_MODE = os.environ.get('AUDIFY_SERVER_MODE', 'threaded')
+ASGI_DEPENDENCIES = ('uvicorn', 'httpx', 'a2wsgi')
+SERVER_HOST = os.environ.get('AUDIFY_HOST', '127.0.0.1')
+SERVER_PORT = int(os.environ.get('AUDIFY_PORT', 5000))
+# How long the launcher waits for /api/health before opening the browser anyway
+SERVER_READY_TIMEOUT = 15
+# Threads for blocking work (yt-dlp, Flask routes) in the asgi mode
+ASYNC_BLOCKING_WORKERS = int(os.environ.get('AUDIFY_ASYNC_WORKERS', 16))
+
+# Maximum number of YoutubeDL instances kept per option profile
+YTDL_POOL_SIZE = int(os.environ.get('AUDIFY_YTDL_POOL_SIZE', 4))
+
+# Resolved stream URLs kept in memory, and how long before the signed URL's
+# expiry an entry is considered stale
+STREAM_CACHE_SIZE = int(os.environ.get('AUDIFY_STREAM_CACHE_SIZE', 256))
+STREAM_EXPIRY_MARGIN = 300
+STREAM_DEFAULT_TTL = 3600
+
+# Upstream audio relay settings for /api/proxy
+PROXY_CHUNK_SIZE = int(os.environ.get('AUDIFY_PROXY_CHUNK_SIZE', 64 * 1024))
+PROXY_POOL_SIZE = int(os.environ.get('AUDIFY_PROXY_POOL_SIZE', 16))
+PROXY_TIMEOUT = (10, 30)
+# Identical proxy requests share one upstream response: for how many
+# seconds after it opens others can join, and how far (in bytes) its
+# fastest reader may run ahead of the slowest before that one switches to
+# its own upstream request
+PROXY_TEE_JOIN_WINDOW = 1.0
+PROXY_TEE_BUFFER_BYTES = int(os.environ.get('AUDIFY_PROXY_TEE_MB', 4)) * 1024 * 1024
+
+# Headers copied between the client and the upstream audio server
+PROXY_REQUEST_HEADERS = ('Range', 'If-Range')
+PROXY_RESPONSE_HEADERS = ('Content-Type', 'Content-Length', 'Content-Range',
+                          'Accept-Ranges', 'Last-Modified', 'ETag')
+
+# On-disk cache of proxied audio, split into fixed-size blocks
+SEGMENT_BLOCK_SIZE = int(os.environ.get('AUDIFY_SEGMENT_BLOCK_SIZE', 256 * 1024))
+SEGMENT_CACHE_MAX_BYTES = int(os.environ.get('AUDIFY_SEGMENT_CACHE_MB', 512)) * 1024 * 1024
+SEGMENT_INDEX_SAVE_INTERVAL = 5
+
+# Prefetching of upcoming tracks: concurrent warm-ups, default and maximum
+# seconds of audio buffered per track, per-track and total byte budgets
+PREFETCH_WORKERS = int(os.environ.get('AUDIFY_PREFETCH_WORKERS', 2))
+PREFETCH_SECONDS = 20
+PREFETCH_MAX_SECONDS = 60
+PREFETCH_MAX_IDS = 5
+PREFETCH_TRACK_MAX_BYTES = 2 * 1024 * 1024
+PREFETCH_BUDGET_BYTES = int(os.environ.get('AUDIFY_PREFETCH_BUDGET_MB', 8)) * 1024 * 1024
+# POST /api/stream/batch: most ids per request and concurrent resolutions
+# (yt-dlp work is further bounded by the pool size)
+STREAM_BATCH_MAX_IDS = 100
+STREAM_BATCH_WORKERS = int(os.environ.get('AUDIFY_STREAM_BATCH_WORKERS', YTDL_POOL_SIZE))
+# Assumed bitrate in kbit/s when a format does not report one
+DEFAULT_AUDIO_BITRATE = 160
 
 logging.basicConfig(
     filename=f'audify_{datetime.now().strftime("%Y%m%d")}.log',
@@ -33,19 +194,248 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+class Metrics:
+    """Process-wide counters, gauges and histograms rendered in the Prometheus
+    text format. An update is one lock and a few additions, cheap enough to
+    leave on; gauges that mirror other state are read by collectors at
+    scrape time."""
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = OrderedDict()
+        self._values = {}
+        self._collectors = []
+
+    def counter(self, name, help_text):
+        self._meta[name] = ('counter', help_text, None)
+
+    def gauge(self, name, help_text):
+        self._meta[name] = ('gauge', help_text, None)
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self._meta[name] = ('histogram', help_text, tuple(buckets))
+
+    def collector(self, func):
+        """Register func() -> iterable of (name, labels, value), called per scrape"""
+        self._collectors.append(func)
+        return func
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        buckets = self._meta[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        index = bisect.bisect_left(buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # Per-bucket counts (made cumulative when rendered), sum, count
+                series = self._values[key] = [0] * (len(buckets) + 2)
+            if index < len(buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    @staticmethod
+    def _escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    @classmethod
+    def _labels(cls, labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{key}="{cls._escape(value)}"' for key, value in pairs) + '}'
+
+    def render(self):
+        with self._lock:
+            values = {key: list(value) if isinstance(value, list) else value
+                      for key, value in self._values.items()}
+        for collect in self._collectors:
+            try:
+                for name, labels, value in collect():
+                    values[(name, tuple(sorted(labels.items())))] = value
+            except Exception as e:
+                print(f"Metrics collector error: {e}")
+
+        by_name = {}
+        for (name, labels), value in values.items():
+            by_name.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name, (kind, help_text, buckets) in self._meta.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in sorted(by_name.get(name, []), key=lambda item: item[0]):
+                if kind != 'histogram':
+                    lines.append(f'{name}{self._labels(labels)} {value}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets, value):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{self._labels(labels, [("le", bound)])} {cumulative}')
+                lines.append(f'{name}_bucket{self._labels(labels, [("le", "+Inf")])} {value[-1]}')
+                lines.append(f'{name}_sum{self._labels(labels)} {value[-2]}')
+                lines.append(f'{name}_count{self._labels(labels)} {value[-1]}')
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+metrics.histogram('audify_http_request_duration_seconds',
+                  'Time until a route returns its response (headers for streamed bodies)')
+metrics.histogram('audify_ytdl_wait_seconds', 'Wait for a free pooled YoutubeDL instance')
+metrics.histogram('audify_ytdl_extract_seconds', 'Time spent in yt-dlp per checkout, by profile')
+metrics.histogram('audify_upstream_ttfb_seconds', 'Upstream audio server time to response headers')
+metrics.counter('audify_upstream_bytes_total', 'Audio bytes read from upstream')
+metrics.counter('audify_proxy_bytes_total', 'Audio bytes sent to clients by /api/proxy, by path')
+metrics.counter('audify_segment_blocks_total', 'Segment cache blocks served to clients, by result')
+metrics.counter('audify_cache_lookups_total', 'Query and stream cache lookups, by cache and result')
+metrics.gauge('audify_cache_entries', 'Entries held per cache')
+metrics.counter('audify_coalesced_calls_total', 'Calls that waited for an identical in-flight call')
+metrics.counter('audify_upstream_shared_total', 'Upstream audio requests served by joining an open one')
+metrics.gauge('audify_download_queue_depth', 'Download jobs waiting for a worker')
+metrics.gauge('audify_download_jobs', 'Known download jobs by status')
+metrics.histogram('audify_persist_seconds', 'Time to write persisted state, by store',
+                  buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+
 class AppDataManager:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tracks (
+            id TEXT PRIMARY KEY,
+            title TEXT,
+            uploader TEXT,
+            thumbnail TEXT,
+            filename TEXT NOT NULL,
+            added_at REAL NOT NULL,
+            codec TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_tracks_filename ON tracks (filename);
+
+        CREATE TABLE IF NOT EXISTS playlists (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            created_at REAL NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS playlist_items (
+            playlist_id TEXT NOT NULL REFERENCES playlists (id) ON DELETE CASCADE,
+            song_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (playlist_id, song_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_playlist_items_position ON playlist_items (playlist_id, position);
+
+        CREATE TABLE IF NOT EXISTS history (
+            query TEXT PRIMARY KEY,
+            searched_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_history_searched_at ON history (searched_at);
+
+        CREATE TABLE IF NOT EXISTS import_matches (
+            name TEXT NOT NULL,
+            artist TEXT NOT NULL,
+            video_id TEXT NOT NULL,
+            data TEXT NOT NULL,
+            resolved_at REAL NOT NULL,
+            PRIMARY KEY (name, artist)
+        );
+
+        CREATE TABLE IF NOT EXISTS query_cache (
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            stale_until REAL NOT NULL,
+            PRIMARY KEY (kind, key)
+        );
+        CREATE INDEX IF NOT EXISTS idx_query_cache_stale_until ON query_cache (stale_until);
+
+        CREATE TABLE IF NOT EXISTS candidates (
+            id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            seen_at REAL NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS related_edges (
+            source_id TEXT NOT NULL,
+            target_id TEXT NOT NULL,
+            weight REAL NOT NULL,
+            seen_at REAL NOT NULL,
+            PRIMARY KEY (source_id, target_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_related_edges_target ON related_edges (target_id);
+
+        CREATE TABLE IF NOT EXISTS related_attempts (
+            track_id TEXT PRIMARY KEY,
+            attempts INTEGER NOT NULL,
+            attempted_at REAL NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS track_activity (
+            track_id TEXT PRIMARY KEY,
+            plays INTEGER NOT NULL DEFAULT 0,
+            searches INTEGER NOT NULL DEFAULT 0,
+            last_seen REAL NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS library_files (
+            directory TEXT NOT NULL,
+            name TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            PRIMARY KEY (directory, name)
+        );
+
+        CREATE TABLE IF NOT EXISTS media_info (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            info TEXT NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
     def __init__(self):
         self.app_name = "nnaudify"
         self.app_data_dir = self._get_app_data_path()
         self.downloads_dir = os.path.join(self.app_data_dir, 'downloads')
+        self.db_file = os.path.join(self.app_data_dir, 'audify.db')
+        # Legacy JSON stores, read once when migrating to the database
         self.metadata_file = os.path.join(self.app_data_dir, 'metadata.json')
         self.search_history_file = os.path.join(self.app_data_dir, 'search_history.json')
         self.playlists_file = os.path.join(self.app_data_dir, 'playlists.json')
+        self.stream_cache_dir = os.path.join(self.app_data_dir, 'stream_cache')
+        self._local = threading.local()
         self._init_directories()
+        self._init_database()
+        # Bumped whenever the tracks table changes, so cached listings can be reused
+        self.tracks_version = 0
+        self.downloads_index = DirectoryIndex(self.downloads_dir, store=self)
+        self.media_probe = MediaProbe(store=self)
 
     def _get_app_data_path(self):
+        # Explicit override, e.g. for benchmarks or a portable install
+        if os.environ.get('AUDIFY_DATA_DIR'):
+            return os.path.abspath(os.environ['AUDIFY_DATA_DIR'])
         try:
             if sys.platform == 'win32':
+                import winreg
                 # Get AppData\Local path on Windows
                 key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, 
                                    r'Software\Microsoft\Windows\CurrentVersion\Explorer\Shell Folders')
@@ -61,147 +451,1388 @@ class AppDataManager:
     def _init_directories(self):
         os.makedirs(self.app_data_dir, exist_ok=True)
         os.makedirs(self.downloads_dir, exist_ok=True)
-        if not os.path.exists(self.metadata_file):
-            self._save_metadata({})
-        if not os.path.exists(self.search_history_file):
-            self._save_search_history([])
-        if not os.path.exists(self.playlists_file):
-            self._save_playlists({})
 
-    def _save_metadata(self, data):
-        with open(self.metadata_file, 'w') as f:
-            json.dump(data, f)
+    def _connection(self):
+        """One connection per thread; WAL lets readers run alongside a writer"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+        return conn
 
-    def _load_metadata(self):
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        with metrics.timer('audify_persist_seconds', store='db'):
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                yield conn
+
+    def _init_database(self):
+        conn = self._connection()
+        conn.executescript(self.SCHEMA)
+        # Columns added after the first release of the schema
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(tracks)')}
+        if 'codec' not in columns:
+            conn.execute('ALTER TABLE tracks ADD COLUMN codec TEXT')
+        # Probe results from an older MediaProbe may miss what it reads now
+        probe_version = conn.execute(
+            "SELECT value FROM settings WHERE key = 'media_probe_version'"
+        ).fetchone()
+        if not probe_version or probe_version['value'] != str(MediaProbe.VERSION):
+            with self._transaction() as conn:
+                conn.execute('DELETE FROM media_info')
+                conn.execute(
+                    "INSERT OR REPLACE INTO settings (key, value) VALUES ('media_probe_version', ?)",
+                    (str(MediaProbe.VERSION),)
+                )
+        migrated = conn.execute(
+            "SELECT value FROM settings WHERE key = 'json_migrated'"
+        ).fetchone()
+        if not migrated:
+            self._migrate_json()
+
+    def _load_json(self, path, default):
         try:
-            with open(self.metadata_file, 'r') as f:
+            with open(path, 'r') as f:
                 return json.load(f)
         except:
-            return {}
+            return default
 
-    def save_download_info(self, track_info):
-        metadata = self._load_metadata()
-        metadata[track_info['id']] = {
-            'title': track_info['title'],
-            'uploader': track_info['uploader'],
-            'thumbnail': track_info.get('thumbnail', ''),
-            'filename': track_info['filename']
+    def _migrate_json(self):
+        """Import the legacy metadata, playlist and history JSON files once"""
+        metadata = self._load_json(self.metadata_file, {})
+        playlists = self._load_json(self.playlists_file, {})
+        history = self._load_json(self.search_history_file, [])
+        now = time.time()
+
+        with self._transaction() as conn:
+            conn.executemany(
+                'INSERT OR IGNORE INTO tracks (id, title, uploader, thumbnail, filename, added_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [
+                    (track_id, info.get('title'), info.get('uploader'),
+                     info.get('thumbnail', ''), info['filename'], now)
+                    for track_id, info in metadata.items() if info.get('filename')
+                ]
+            )
+            for playlist_id, playlist in playlists.items():
+                conn.execute(
+                    'INSERT OR IGNORE INTO playlists (id, name, created_at) VALUES (?, ?, ?)',
+                    (playlist_id, playlist.get('name', ''), playlist.get('created_at', now))
+                )
+                conn.executemany(
+                    'INSERT OR IGNORE INTO playlist_items (playlist_id, song_id, position, data) '
+                    'VALUES (?, ?, ?, ?)',
+                    [
+                        (playlist_id, song['id'], position, json.dumps(song))
+                        for position, song in enumerate(playlist.get('songs', []))
+                        if song.get('id')
+                    ]
+                )
+            conn.executemany(
+                'INSERT OR IGNORE INTO history (query, searched_at) VALUES (?, ?)',
+                [(query, now + i * 1e-6) for i, query in enumerate(history[-SEARCH_HISTORY_LIMIT:])]
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO settings (key, value) VALUES ('json_migrated', ?)",
+                (str(now),)
+            )
+        logging.info("Migrated JSON app data to SQLite")
+
+    def _load_metadata(self):
+        rows = self._connection().execute(
+            'SELECT id, title, uploader, thumbnail, filename, codec FROM tracks ORDER BY added_at'
+        ).fetchall()
+        return {
+            row['id']: {
+                'title': row['title'],
+                'uploader': row['uploader'],
+                'thumbnail': row['thumbnail'],
+                'filename': row['filename'],
+                'codec': row['codec']
+            }
+            for row in rows
         }
-        self._save_metadata(metadata)
+
+    def save_download_info(self, track_info):
+        with self._transaction() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO tracks (id, title, uploader, thumbnail, filename, added_at, codec) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (track_info['id'], track_info['title'], track_info['uploader'],
+                 track_info.get('thumbnail', ''), track_info['filename'], time.time(),
+                 track_info.get('codec'))
+            )
+        self.tracks_version += 1
+        self.downloads_index.invalidate()
+        # Probe now so listings don't pay for it on first view
+        self.media_probe.info(os.path.join(self.downloads_dir, track_info['filename']))
 
     def get_downloads(self):
+        files = self.downloads_index.files()
         metadata = self._load_metadata()
-        return [
-            {
+        downloads = []
+        for track_id, info in metadata.items():
+            if info['filename'] not in files:
+                continue
+            path = os.path.join(self.downloads_dir, info['filename'])
+            size, mtime = files[info['filename']]
+            # Probed details fill in what the database does not know; stored
+            # fields such as the codec chosen at download time win
+            stored = {key: value for key, value in info.items() if value is not None}
+            downloads.append({
                 'id': track_id,
-                **info,
-                'path': os.path.join(self.downloads_dir, info['filename'])
-            }
-            for track_id, info in metadata.items()
-            if os.path.exists(os.path.join(self.downloads_dir, info['filename']))
-        ]
+                **self.media_probe.info(path, size, mtime),
+                **stored,
+                'path': path
+            })
+        return downloads
+
+    def load_media_info(self, path):
+        row = self._connection().execute(
+            'SELECT size, mtime, info FROM media_info WHERE path = ?', (path,)
+        ).fetchone()
+        if row:
+            return row['size'], row['mtime'], json.loads(row['info'])
+        return None
+
+    def save_media_info(self, path, size, mtime, info):
+        with self._transaction() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO media_info (path, size, mtime, info) VALUES (?, ?, ?, ?)',
+                (path, size, mtime, json.dumps(info))
+            )
+
+    def load_library_files(self, directory):
+        rows = self._connection().execute(
+            'SELECT name, size, mtime FROM library_files WHERE directory = ?', (directory,)
+        ).fetchall()
+        return {row['name']: (row['size'], row['mtime']) for row in rows}
 
-    def _save_search_history(self, data):
-        with open(self.search_history_file, 'w') as f:
-            json.dump(data, f)
+    def update_library_files(self, directory, changed, removed):
+        with self._transaction() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO library_files (directory, name, size, mtime) VALUES (?, ?, ?, ?)',
+                [(directory, name, size, mtime) for name, (size, mtime) in changed.items()]
+            )
+            conn.executemany(
+                'DELETE FROM library_files WHERE directory = ? AND name = ?',
+                [(directory, name) for name in removed]
+            )
+
+    def get_track(self, track_id):
+        row = self._connection().execute(
+            'SELECT id, title, uploader, thumbnail, filename FROM tracks WHERE id = ?', (track_id,)
+        ).fetchone()
+        return dict(row) if row else None
 
     def _load_search_history(self):
-        try:
-            with open(self.search_history_file, 'r') as f:
-                return json.load(f)
-        except:
-            return []
+        rows = self._connection().execute(
+            'SELECT query FROM history ORDER BY searched_at'
+        ).fetchall()
+        return [row['query'] for row in rows]
 
     def add_search_query(self, query):
-        history = self._load_search_history()
-        if query not in history:
-            history.append(query)
-            # Keep only last 20 searches
-            history = history[-20:]
-            self._save_search_history(history)
-
-    def get_recommendations(self):
-        history = self._load_search_history()
-        downloads = self.get_downloads()
-        
-        # Combine search history and download titles
-        recommendation_sources = history + [
-            download['title'] for download in downloads
-        ]
-        
-        if not recommendation_sources:
-            return []
-            
-        # Randomly select a query to base recommendations on
-        query = random.choice(recommendation_sources)
-        
-        # Use YouTubeManager to get recommendations
-        yt = YouTubeManager()
-        results = yt.search(query)
-        if results and len(results) > 0:
-            video_id = results[0]['id']
-            return yt.get_related(video_id)
-        return []
+        with self._transaction() as conn:
+            inserted = conn.execute(
+                'INSERT OR IGNORE INTO history (query, searched_at) VALUES (?, ?)',
+                (query, time.time())
+            ).rowcount
+            if inserted:
+                # Keep only the most recent searches
+                conn.execute(
+                    'DELETE FROM history WHERE query NOT IN '
+                    '(SELECT query FROM history ORDER BY searched_at DESC LIMIT ?)',
+                    (SEARCH_HISTORY_LIMIT,)
+                )
 
-    def _save_playlists(self, data):
-        with open(self.playlists_file, 'w') as f:
-            json.dump(data, f)
+    def record_candidates(self, tracks):
+        """Remember tracks seen in search or related results"""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO candidates (id, data, seen_at) VALUES (?, ?, ?)',
+                [(track['id'], json.dumps(track), now) for track in tracks if track.get('id')]
+            )
 
-    def _load_playlists(self):
-        try:
-            with open(self.playlists_file, 'r') as f:
-                return json.load(f)
-        except:
-            return {}
+    def record_related(self, source_id, tracks):
+        """Add edges from a track to its related tracks, stronger for higher ranks"""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO candidates (id, data, seen_at) VALUES (?, ?, ?)',
+                [(track['id'], json.dumps(track), now) for track in tracks if track.get('id')]
+            )
+            conn.executemany(
+                'INSERT OR REPLACE INTO related_edges (source_id, target_id, weight, seen_at) '
+                'VALUES (?, ?, ?, ?)',
+                [
+                    (source_id, track['id'], 1 / (1 + 0.2 * rank), now)
+                    for rank, track in enumerate(tracks) if track.get('id')
+                ]
+            )
+            if tracks:
+                conn.execute('DELETE FROM related_attempts WHERE track_id = ?', (source_id,))
+
+    def record_related_failure(self, track_id):
+        """Note a seed whose related tracks could not be fetched, so it is
+        only retried after a growing delay"""
+        with self._transaction() as conn:
+            conn.execute(
+                'INSERT INTO related_attempts (track_id, attempts, attempted_at) VALUES (?, 1, ?) '
+                'ON CONFLICT (track_id) DO UPDATE SET attempts = attempts + 1, attempted_at = excluded.attempted_at',
+                (track_id, time.time())
+            )
+
+    def record_activity(self, track_id, kind):
+        """Count a play or a search hit for a track; kind is 'plays' or 'searches'"""
+        if kind not in ('plays', 'searches'):
+            raise ValueError(f"Unknown activity kind: {kind}")
+        with self._transaction() as conn:
+            conn.execute(
+                f'INSERT INTO track_activity (track_id, {kind}, last_seen) VALUES (?, 1, ?) '
+                f'ON CONFLICT (track_id) DO UPDATE SET {kind} = {kind} + 1, last_seen = excluded.last_seen',
+                (track_id, time.time())
+            )
+
+    # Tracks the user has shown interest in, weighted by how strongly
+    SEEDS_QUERY = """
+        WITH activity AS (
+            SELECT id AS track_id, :download AS weight FROM tracks
+            UNION ALL SELECT song_id, :playlist FROM playlist_items
+            UNION ALL SELECT track_id, plays * :play + searches * :search FROM track_activity
+        )
+        SELECT track_id, SUM(weight) AS weight FROM activity GROUP BY track_id
+    """
+
+    def seeds_without_related(self, limit):
+        """Strongest seeds whose related tracks have not been recorded yet,
+        leaving out failed ones until their retry delay has passed"""
+        rows = self._connection().execute(
+            f'WITH seeds AS ({self.SEEDS_QUERY}) '
+            'SELECT track_id FROM seeds '
+            'WHERE track_id NOT IN (SELECT source_id FROM related_edges) '
+            'AND track_id NOT IN ('
+            '    SELECT track_id FROM related_attempts '
+            '    WHERE attempted_at + MIN(:retry_delay * (1 << MIN(attempts - 1, 30)), :retry_max) > :now'
+            ') '
+            'ORDER BY weight DESC, track_id LIMIT :limit',
+            {**RECOMMENDATION_WEIGHTS, 'limit': limit, 'now': time.time(),
+             'retry_delay': RECOMMENDATION_RETRY_DELAY, 'retry_max': RECOMMENDATION_RETRY_MAX_DELAY}
+        ).fetchall()
+        return [row['track_id'] for row in rows]
+
+    def rank_candidates(self, limit):
+        """Candidates ordered by the summed seed weight of the edges reaching them,
+        leaving out tracks that are already downloaded"""
+        rows = self._connection().execute(
+            f'WITH seeds AS ({self.SEEDS_QUERY}) '
+            'SELECT c.data, SUM(s.weight * e.weight) AS score '
+            'FROM related_edges e '
+            'JOIN seeds s ON s.track_id = e.source_id '
+            'JOIN candidates c ON c.id = e.target_id '
+            'WHERE e.target_id NOT IN (SELECT id FROM tracks) '
+            'GROUP BY e.target_id '
+            'ORDER BY score DESC, e.target_id LIMIT :limit',
+            {**RECOMMENDATION_WEIGHTS, 'limit': limit}
+        ).fetchall()
+        return [json.loads(row['data']) for row in rows]
+
+    def get_playlists(self):
+        conn = self._connection()
+        playlists = {
+            row['id']: {'name': row['name'], 'songs': [], 'created_at': row['created_at']}
+            for row in conn.execute('SELECT id, name, created_at FROM playlists ORDER BY created_at')
+        }
+        for row in conn.execute(
+            'SELECT playlist_id, data FROM playlist_items ORDER BY playlist_id, position'
+        ):
+            if row['playlist_id'] in playlists:
+                playlists[row['playlist_id']]['songs'].append(json.loads(row['data']))
+
+        # Songs that are downloaded get their real duration from the file
+        durations = {track['id']: track['duration'] for track in self.get_downloads() if 'duration' in track}
+        for playlist in playlists.values():
+            for song in playlist['songs']:
+                if song.get('id') in durations:
+                    song['duration'] = durations[song['id']]
+        return playlists
 
     def create_playlist(self, name):
-        playlists = self._load_playlists()
         playlist_id = str(uuid.uuid4())
-        playlists[playlist_id] = {
-            'name': name,
-            'songs': [],
-            'created_at': time.time()
-        }
-        self._save_playlists(playlists)
+        with self._transaction() as conn:
+            conn.execute(
+                'INSERT INTO playlists (id, name, created_at) VALUES (?, ?, ?)',
+                (playlist_id, name, time.time())
+            )
         return playlist_id
 
+    def delete_playlist(self, playlist_id):
+        with self._transaction() as conn:
+            return conn.execute('DELETE FROM playlists WHERE id = ?', (playlist_id,)).rowcount > 0
+
     def add_song_to_playlist(self, playlist_id, song_data):
-        playlists = self._load_playlists()
-        if playlist_id in playlists:
-            if song_data['id'] not in [s['id'] for s in playlists[playlist_id]['songs']]:
-                playlists[playlist_id]['songs'].append(song_data)
-                self._save_playlists(playlists)
-                return True
-        return False
+        with self._transaction() as conn:
+            if not conn.execute('SELECT 1 FROM playlists WHERE id = ?', (playlist_id,)).fetchone():
+                return False
+            position = conn.execute(
+                'SELECT COALESCE(MAX(position) + 1, 0) FROM playlist_items WHERE playlist_id = ?',
+                (playlist_id,)
+            ).fetchone()[0]
+            return conn.execute(
+                'INSERT OR IGNORE INTO playlist_items (playlist_id, song_id, position, data) '
+                'VALUES (?, ?, ?, ?)',
+                (playlist_id, song_data['id'], position, json.dumps(song_data))
+            ).rowcount > 0
+
+    def add_songs_to_playlist(self, playlist_id, songs):
+        """Append several songs in one transaction; returns how many were added"""
+        with self._transaction() as conn:
+            if not conn.execute('SELECT 1 FROM playlists WHERE id = ?', (playlist_id,)).fetchone():
+                return 0
+            position = conn.execute(
+                'SELECT COALESCE(MAX(position) + 1, 0) FROM playlist_items WHERE playlist_id = ?',
+                (playlist_id,)
+            ).fetchone()[0]
+            added = 0
+            for song in songs:
+                added += conn.execute(
+                    'INSERT OR IGNORE INTO playlist_items (playlist_id, song_id, position, data) '
+                    'VALUES (?, ?, ?, ?)',
+                    (playlist_id, song['id'], position + added, json.dumps(song))
+                ).rowcount
+            return added
 
     def remove_song_from_playlist(self, playlist_id, song_id):
-        playlists = self._load_playlists()
-        if playlist_id in playlists:
-            playlists[playlist_id]['songs'] = [
-                s for s in playlists[playlist_id]['songs']
-                if s['id'] != song_id
-            ]
-            self._save_playlists(playlists)
+        with self._transaction() as conn:
+            if not conn.execute('SELECT 1 FROM playlists WHERE id = ?', (playlist_id,)).fetchone():
+                return False
+            conn.execute(
+                'DELETE FROM playlist_items WHERE playlist_id = ? AND song_id = ?',
+                (playlist_id, song_id)
+            )
             return True
-        return False
+
+    def _match_key(self, name, artist):
+        return (name or '').strip().lower(), (artist or '').strip().lower()
+
+    def get_import_match(self, name, artist):
+        """Previously resolved YouTube track for a Spotify (name, artist) pair"""
+        row = self._connection().execute(
+            'SELECT data FROM import_matches WHERE name = ? AND artist = ?',
+            self._match_key(name, artist)
+        ).fetchone()
+        return json.loads(row['data']) if row else None
+
+    def save_import_match(self, name, artist, track):
+        with self._transaction() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO import_matches (name, artist, video_id, data, resolved_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (*self._match_key(name, artist), track['id'], json.dumps(track), time.time())
+            )
+
+    def load_cached_query(self, kind, key):
+        """Return (value, expires_at) of a persisted lookup result, or None"""
+        row = self._connection().execute(
+            'SELECT value, expires_at FROM query_cache WHERE kind = ? AND key = ? AND stale_until > ?',
+            (kind, key, time.time())
+        ).fetchone()
+        return (json.loads(row['value']), row['expires_at']) if row else None
+
+    def save_cached_query(self, kind, key, value, expires_at, stale_until):
+        with self._transaction() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO query_cache (kind, key, value, expires_at, stale_until) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (kind, key, json.dumps(value), expires_at, stale_until)
+            )
+            # Dead rows are dropped opportunistically rather than on a timer
+            if random.random() < 0.01:
+                conn.execute('DELETE FROM query_cache WHERE stale_until < ?', (time.time(),))
+
+class DirectoryIndex:
+    """In-memory listing of a directory (name -> (size, mtime)). It is
+    reconciled with a single os.scandir pass and re-checked cheaply: a stat of
+    the directory at most every LIBRARY_CHECK_INTERVAL seconds, a full rescan
+    every LIBRARY_RESCAN_INTERVAL. With a store, the listing is persisted."""
+    def __init__(self, path, suffixes=None, store=None):
+        self.path = path
+        self.suffixes = suffixes
+        self.store = store
+        self.version = 0
+        self._lock = threading.Lock()
+        self._files = store.load_library_files(path) if store else {}
+        self._dir_mtime = None
+        self._last_check = 0
+        self._last_scan = 0
+        self.refresh(force=True)
+
+    def files(self):
+        now = time.time()
+        if now - self._last_check >= LIBRARY_CHECK_INTERVAL:
+            self.refresh(force=now - self._last_scan >= LIBRARY_RESCAN_INTERVAL)
+        with self._lock:
+            return self._files
+
+    def invalidate(self):
+        """Make the next files() call look at the directory again"""
+        self._last_check = 0
+
+    def refresh(self, force=False):
+        with self._lock:
+            self._last_check = time.time()
+            try:
+                dir_mtime = os.stat(self.path).st_mtime_ns
+            except OSError:
+                dir_mtime = None
+            if not force and dir_mtime == self._dir_mtime:
+                return
+
+            scanned = {}
+            if dir_mtime is not None:
+                with os.scandir(self.path) as entries:
+                    for entry in entries:
+                        if self.suffixes and not entry.name.endswith(self.suffixes):
+                            continue
+                        try:
+                            if entry.is_file():
+                                stat = entry.stat()
+                                scanned[entry.name] = (stat.st_size, stat.st_mtime)
+                        except OSError:
+                            continue
+            self._dir_mtime = dir_mtime
+            self._last_scan = self._last_check
+            if scanned == self._files:
+                return
+
+            changed = {name: info for name, info in scanned.items() if self._files.get(name) != info}
+            removed = [name for name in self._files if name not in scanned]
+            # Readers keep the old dict; the new one replaces it whole
+            self._files = scanned
+            self.version += 1
+
+        if self.store:
+            try:
+                self.store.update_library_files(self.path, changed, removed)
+            except Exception as e:
+                print(f"Library index save error: {e}")
+
+class MediaProbe:
+    """Reads duration, bitrate, sample rate and tags from MP3, FLAC and WAV
+    headers, and duration and codec from MP4/M4A, WebM and Ogg. Files are memory-mapped so only the header pages are touched.
+    Results are cached per path with the size and mtime they were read at,
+    in memory and in the store."""
+    MP3_BITRATES = {
+        (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+        (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+        (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+        (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+        (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+        (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    }
+    MP3_SAMPLE_RATES = {1: (44100, 48000, 32000), 2: (22050, 24000, 16000), 2.5: (11025, 12000, 8000)}
+    ID3_TAGS = {
+        'TIT2': 'title', 'TPE1': 'artist', 'TALB': 'album',
+        'TT2': 'title', 'TP1': 'artist', 'TAL': 'album',
+    }
+    VORBIS_TAGS = {'TITLE': 'title', 'ARTIST': 'artist', 'ALBUM': 'album'}
+    MP4_CODECS = {b'mp4a': 'aac', b'Opus': 'opus', b'fLaC': 'flac', b'.mp3': 'mp3'}
+    MP4_CONTAINERS = {b'moov', b'trak', b'mdia', b'minf', b'stbl', b'mvex'}
+    WEBM_CODECS = {'A_OPUS': 'opus', 'A_VORBIS': 'vorbis', 'A_AAC': 'aac'}
+    # EBML ids: Segment, Info, TimecodeScale, Duration, Tracks, TrackEntry,
+    # CodecID, Audio, SamplingFrequency, Channels
+    EBML_SEGMENT, EBML_INFO, EBML_TIMECODE_SCALE, EBML_DURATION = 0x18538067, 0x1549A966, 0x2AD7B1, 0x4489
+    EBML_TRACKS, EBML_TRACK, EBML_CODEC, EBML_AUDIO = 0x1654AE6B, 0xAE, 0x86, 0xE1
+    EBML_SAMPLE_RATE, EBML_CHANNELS = 0xB5, 0x9F
+    # How far from the end of an Ogg file to look for its last page
+    OGG_TAIL_BYTES = 64 * 1024
+    # How far past the ID3 tag to look for the first MPEG frame
+    SYNC_SEARCH_BYTES = 64 * 1024
+    # Bumped when probing learns new formats, so stored results are redone
+    VERSION = 2
+
+    def __init__(self, store=None):
+        self.store = store
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def info(self, path, size=None, mtime=None):
+        """Probe result for path ({} if it can't be read or parsed)"""
+        if size is None or mtime is None:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return {}
+            size, mtime = stat.st_size, stat.st_mtime
+
+        with self._lock:
+            cached = self._cache.get(path)
+            if cached and cached[:2] == (size, mtime):
+                return cached[2]
+
+        info = None
+        if self.store:
+            stored = self.store.load_media_info(path)
+            if stored and stored[:2] == (size, mtime):
+                info = stored[2]
+        if info is None:
+            info = self.probe(path)
+            if self.store:
+                try:
+                    self.store.save_media_info(path, size, mtime, info)
+                except Exception as e:
+                    print(f"Media info save error: {e}")
+
+        with self._lock:
+            # One entry per path; an older (size, mtime) is replaced
+            self._cache[path] = (size, mtime, info)
+        return info
+
+    def probe(self, path):
+        try:
+            with open(path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return {}
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    if data[:4] == b'fLaC':
+                        info = self._probe_flac(data)
+                    elif data[:4] == b'RIFF' and data[8:12] == b'WAVE':
+                        info = self._probe_wav(data)
+                    elif data[:3] == b'ID3' or path.lower().endswith('.mp3'):
+                        info = self._probe_mp3(data)
+                    elif data[4:8] == b'ftyp':
+                        info = self._probe_mp4(data)
+                    elif data[:4] == b'\x1a\x45\xdf\xa3':
+                        info = self._probe_webm(data)
+                    elif data[:4] == b'OggS':
+                        info = self._probe_ogg(data)
+                    else:
+                        info = {}
+        except (OSError, ValueError, struct.error, IndexError) as e:
+            print(f"Media probe error for {path}: {e}")
+            return {}
+        if info.get('duration'):
+            info['duration'] = round(info['duration'], 3)
+        return info
+
+    def _probe_mp3(self, data):
+        size = len(data)
+        tags = {}
+        start = 0
+        if data[:3] == b'ID3':
+            start, tags = self._read_id3v2(data)
+        end = size
+        if size >= 128 and data[size - 128:size - 125] == b'TAG':
+            end = size - 128
+            if not tags:
+                tags = self._read_id3v1(data[end:])
+
+        header = self._find_mp3_frame(data, start)
+        if header is None:
+            return {'codec': 'mp3', 'tags': tags} if tags else {}
+        offset, version, layer, bitrate, sample_rate, channels = header
+        samples_per_frame = 384 if layer == 1 else (1152 if layer == 2 or version == 1 else 576)
+
+        info = {'codec': 'mp3', 'sample_rate': sample_rate, 'channels': channels, 'tags': tags}
+        frames, audio_bytes = self._read_vbr_header(data, offset, version, layer, channels)
+        audio_bytes = audio_bytes or end - offset
+        if frames:
+            info['duration'] = frames * samples_per_frame / sample_rate
+            info['bitrate'] = int(audio_bytes * 8 / info['duration'] / 1000) if info['duration'] else bitrate
+        else:
+            info['duration'] = audio_bytes * 8 / (bitrate * 1000)
+            info['bitrate'] = bitrate
+        return info
+
+    def _find_mp3_frame(self, data, start):
+        limit = min(len(data) - 4, start + self.SYNC_SEARCH_BYTES)
+        offset = data.find(b'\xff', start, limit)
+        while 0 <= offset < limit:
+            b1, b2, b3 = data[offset + 1], data[offset + 2], data[offset + 3]
+            if b1 & 0xE0 == 0xE0:
+                version = {3: 1, 2: 2, 0: 2.5}.get((b1 >> 3) & 3)
+                layer = 4 - ((b1 >> 1) & 3)
+                bitrate_index, rate_index = b2 >> 4, (b2 >> 2) & 3
+                if version and layer != 4 and 0 < bitrate_index < 15 and rate_index != 3:
+                    bitrate = self.MP3_BITRATES[(1 if version == 1 else 2, layer)][bitrate_index]
+                    sample_rate = self.MP3_SAMPLE_RATES[version][rate_index]
+                    channels = 1 if b3 >> 6 == 3 else 2
+                    return offset, version, layer, bitrate, sample_rate, channels
+            offset = data.find(b'\xff', offset + 1, limit)
+        return None
+
+    def _read_vbr_header(self, data, offset, version, layer, channels):
+        """(frames, bytes) from a Xing/Info or VBRI header, or (None, None)"""
+        if layer == 3:
+            side_info = (17 if channels == 1 else 32) if version == 1 else (9 if channels == 1 else 17)
+            xing = offset + 4 + side_info
+            if data[xing:xing + 4] in (b'Xing', b'Info'):
+                flags = struct.unpack('>I', data[xing + 4:xing + 8])[0]
+                position = xing + 8
+                frames = audio_bytes = None
+                if flags & 1:
+                    frames = struct.unpack('>I', data[position:position + 4])[0]
+                    position += 4
+                if flags & 2:
+                    audio_bytes = struct.unpack('>I', data[position:position + 4])[0]
+                return frames, audio_bytes
+        vbri = offset + 36
+        if data[vbri:vbri + 4] == b'VBRI':
+            audio_bytes, frames = struct.unpack('>II', data[vbri + 10:vbri + 18])
+            return frames, audio_bytes
+        return None, None
+
+    def _read_id3v2(self, data):
+        """(end of tag, tags) for the ID3v2 tag at the start of data"""
+        major, flags = data[3], data[5]
+        tag_size = self._syncsafe(data[6:10])
+        end = 10 + tag_size + (10 if flags & 0x10 else 0)
+        tags = {}
+        position = 10
+        if major >= 3 and flags & 0x40:
+            extended = data[10:14]
+            position += self._syncsafe(extended) if major == 4 else struct.unpack('>I', extended)[0] + 4
+
+        id_length, header_length = (3, 6) if major == 2 else (4, 10)
+        while position + header_length <= 10 + tag_size:
+            frame_id = data[position:position + id_length]
+            if not frame_id.strip(b'\x00'):
+                break
+            if major == 2:
+                frame_size = int.from_bytes(data[position + 3:position + 6], 'big')
+            elif major == 4:
+                frame_size = self._syncsafe(data[position + 4:position + 8])
+            else:
+                frame_size = struct.unpack('>I', data[position + 4:position + 8])[0]
+            body = position + header_length
+            name = self.ID3_TAGS.get(frame_id.decode('latin-1'))
+            if name and frame_size > 1:
+                text = self._decode_id3_text(data[body:body + frame_size])
+                if text:
+                    tags[name] = text
+            position = body + frame_size
+        return end, tags
+
+    @staticmethod
+    def _syncsafe(raw):
+        return (raw[0] << 21) | (raw[1] << 14) | (raw[2] << 7) | raw[3]
+
+    @staticmethod
+    def _decode_id3_text(raw):
+        encoding = {0: 'latin-1', 1: 'utf-16', 2: 'utf-16-be', 3: 'utf-8'}.get(raw[0], 'latin-1')
+        text = raw[1:].decode(encoding, errors='replace')
+        # Multiple values are NUL-separated; keep the first
+        return text.split('\x00')[0].strip()
+
+    @staticmethod
+    def _read_id3v1(raw):
+        tags = {}
+        for name, start in (('title', 3), ('artist', 33), ('album', 63)):
+            value = raw[start:start + 30].split(b'\x00')[0].decode('latin-1').strip()
+            if value:
+                tags[name] = value
+        return tags
+
+    def _probe_flac(self, data):
+        info = {'codec': 'flac', 'tags': {}}
+        position = 4
+        last = False
+        while not last and position + 4 <= len(data):
+            block_type = data[position] & 0x7F
+            last = bool(data[position] & 0x80)
+            length = int.from_bytes(data[position + 1:position + 4], 'big')
+            body = position + 4
+            if block_type == 0:
+                packed = int.from_bytes(data[body + 10:body + 18], 'big')
+                sample_rate = packed >> 44
+                total_samples = packed & 0xFFFFFFFFF
+                info['sample_rate'] = sample_rate
+                info['channels'] = ((packed >> 41) & 0x7) + 1
+                if sample_rate and total_samples:
+                    info['duration'] = total_samples / sample_rate
+            elif block_type == 4:
+                info['tags'] = self._read_vorbis_comments(data[body:body + length])
+            position = body + length
+        if info.get('duration'):
+            info['bitrate'] = int(len(data) * 8 / info['duration'] / 1000)
+        return info
+
+    def _read_vorbis_comments(self, raw):
+        tags = {}
+        vendor_length = struct.unpack('<I', raw[:4])[0]
+        position = 4 + vendor_length
+        count = struct.unpack('<I', raw[position:position + 4])[0]
+        position += 4
+        for _ in range(count):
+            length = struct.unpack('<I', raw[position:position + 4])[0]
+            key, _, value = raw[position + 4:position + 4 + length].decode('utf-8', errors='replace').partition('=')
+            name = self.VORBIS_TAGS.get(key.upper())
+            if name and name not in tags:
+                tags[name] = value
+            position += 4 + length
+        return tags
+
+    def _probe_wav(self, data):
+        info = {'codec': 'wav', 'tags': {}}
+        byte_rate = None
+        position = 12
+        while position + 8 <= len(data):
+            chunk_id = data[position:position + 4]
+            length = struct.unpack('<I', data[position + 4:position + 8])[0]
+            body = position + 8
+            if chunk_id == b'fmt ':
+                channels, sample_rate, byte_rate = struct.unpack('<HII', data[body + 2:body + 12])
+                info.update(sample_rate=sample_rate, channels=channels, bitrate=byte_rate * 8 // 1000)
+            elif chunk_id == b'data':
+                if byte_rate:
+                    info['duration'] = min(length, len(data) - body) / byte_rate
+                break
+            position = body + length + (length & 1)
+        return info
+
+    def _mp4_boxes(self, data, start, end):
+        """(type, body start, box end) of the boxes between start and end"""
+        position = start
+        while position + 8 <= end:
+            size, box_type = struct.unpack('>I4s', data[position:position + 8])
+            body = position + 8
+            if size == 1:
+                size = struct.unpack('>Q', data[body:body + 8])[0]
+                body += 8
+            elif size == 0:
+                size = end - position
+            if size < body - position:
+                return
+            yield box_type, body, min(position + size, end)
+            position += size
+
+    def _probe_mp4(self, data):
+        info = {'tags': {}}
+        fragments = []
+        stack = [(0, len(data))]
+        while stack:
+            start, end = stack.pop()
+            for box_type, body, box_end in self._mp4_boxes(data, start, end):
+                if box_type in self.MP4_CONTAINERS:
+                    stack.append((body, box_end))
+                elif box_type == b'mvhd':
+                    if data[body] == 1:
+                        timescale, duration = struct.unpack('>IQ', data[body + 20:body + 32])
+                    else:
+                        timescale, duration = struct.unpack('>II', data[body + 12:body + 20])
+                    info['timescale'] = timescale
+                    if timescale and duration:
+                        info['duration'] = duration / timescale
+                elif box_type == b'mehd':
+                    # Fragmented files give their length here, in mvhd units
+                    fmt = '>Q' if data[body] == 1 else '>I'
+                    info['fragment_duration'] = struct.unpack(fmt, data[body + 4:body + 4 + struct.calcsize(fmt)])[0]
+                elif box_type == b'sidx':
+                    fragments.append(self._read_sidx(data, body))
+                elif box_type == b'stsd' and 'codec' not in info:
+                    entry = body + 8
+                    info['codec'] = self.MP4_CODECS.get(data[entry + 4:entry + 8], data[entry + 4:entry + 8].decode('latin-1').strip())
+                    info['channels'] = struct.unpack('>H', data[entry + 24:entry + 26])[0]
+                    info['sample_rate'] = struct.unpack('>I', data[entry + 32:entry + 36])[0] >> 16
+
+        timescale = info.pop('timescale', None)
+        fragment_duration = info.pop('fragment_duration', None)
+        if not info.get('duration'):
+            if fragment_duration and timescale:
+                info['duration'] = fragment_duration / timescale
+            elif fragments:
+                info['duration'] = sum(fragments)
+        if info.get('duration'):
+            info['bitrate'] = int(len(data) * 8 / info['duration'] / 1000)
+        return info
+
+    @staticmethod
+    def _read_sidx(data, body):
+        """Seconds covered by a segment index box"""
+        version = data[body]
+        timescale = struct.unpack('>I', data[body + 8:body + 12])[0]
+        position = body + (20 if version == 0 else 28)
+        count = struct.unpack('>H', data[position + 2:position + 4])[0]
+        position += 4
+        total = 0
+        for _ in range(count):
+            total += struct.unpack('>I', data[position + 4:position + 8])[0]
+            position += 12
+        return total / timescale if timescale else 0
+
+    @staticmethod
+    def _ebml_vint(data, position, keep_marker=False):
+        """(value, length) of the EBML variable-length integer at position"""
+        first = data[position]
+        length = 8 - first.bit_length() + 1
+        if length > 8:
+            raise ValueError('Invalid EBML integer')
+        value = first if keep_marker else first & (0xFF >> length)
+        for byte in data[position + 1:position + length]:
+            value = (value << 8) | byte
+        return value, length
+
+    def _ebml_elements(self, data, start, end):
+        """(id, body start, body end) of the EBML elements between start and end"""
+        position = start
+        while position < end:
+            element_id, id_length = self._ebml_vint(data, position, keep_marker=True)
+            size, size_length = self._ebml_vint(data, position + id_length)
+            body = position + id_length + size_length
+            # An all-ones size means 'unknown': the element runs to the end
+            if size == (1 << (7 * size_length)) - 1:
+                size = end - body
+            yield element_id, body, min(body + size, end)
+            position = body + size
+
+    def _probe_webm(self, data):
+        info = {'tags': {}}
+        scale, duration = 1000000, None
+        for element_id, body, end in self._ebml_elements(data, 0, len(data)):
+            if element_id != self.EBML_SEGMENT:
+                continue
+            for child_id, child, child_end in self._ebml_elements(data, body, end):
+                if child_id == self.EBML_INFO:
+                    for field_id, field, field_end in self._ebml_elements(data, child, child_end):
+                        if field_id == self.EBML_TIMECODE_SCALE:
+                            scale = int.from_bytes(data[field:field_end], 'big')
+                        elif field_id == self.EBML_DURATION:
+                            duration = struct.unpack('>f' if field_end - field == 4 else '>d', data[field:field_end])[0]
+                elif child_id == self.EBML_TRACKS:
+                    self._read_webm_track(data, child, child_end, info)
+                if duration is not None and 'codec' in info:
+                    break
+            break
+        if duration:
+            info['duration'] = duration * scale / 1e9
+            info['bitrate'] = int(len(data) * 8 / info['duration'] / 1000)
+        return info
+
+    def _read_webm_track(self, data, start, end, info):
+        for track_id, track, track_end in self._ebml_elements(data, start, end):
+            if track_id != self.EBML_TRACK:
+                continue
+            for field_id, field, field_end in self._ebml_elements(data, track, track_end):
+                if field_id == self.EBML_CODEC:
+                    codec = data[field:field_end].decode('ascii', errors='replace').rstrip('\x00')
+                    info['codec'] = self.WEBM_CODECS.get(codec, codec)
+                elif field_id == self.EBML_AUDIO:
+                    for audio_id, audio, audio_end in self._ebml_elements(data, field, field_end):
+                        if audio_id == self.EBML_SAMPLE_RATE:
+                            fmt = '>f' if audio_end - audio == 4 else '>d'
+                            info['sample_rate'] = int(struct.unpack(fmt, data[audio:audio_end])[0])
+                        elif audio_id == self.EBML_CHANNELS:
+                            info['channels'] = int.from_bytes(data[audio:audio_end], 'big')
+            if 'codec' in info:
+                return
+
+    def _probe_ogg(self, data):
+        info = {'tags': {}}
+        # The first packet starts after the page header and its segment table
+        packet = 27 + data[26]
+        pre_skip, rate = 0, None
+        if data[packet:packet + 8] == b'OpusHead':
+            channels, pre_skip = struct.unpack('<BH', data[packet + 9:packet + 12])
+            info.update(codec='opus', channels=channels, sample_rate=struct.unpack('<I', data[packet + 12:packet + 16])[0])
+            # Opus granule positions always count 48 kHz samples
+            rate = 48000
+        elif data[packet:packet + 7] == b'\x01vorbis':
+            channels, rate = struct.unpack('<BI', data[packet + 11:packet + 16])
+            info.update(codec='vorbis', channels=channels, sample_rate=rate)
+        last_page = data.rfind(b'OggS', max(0, len(data) - self.OGG_TAIL_BYTES))
+        if rate and last_page >= 0:
+            granule = struct.unpack('<q', data[last_page + 6:last_page + 14])[0]
+            if granule > pre_skip:
+                info['duration'] = (granule - pre_skip) / rate
+                info['bitrate'] = int(len(data) * 8 / info['duration'] / 1000)
+        return info
 
 class MusicManager:
-    def __init__(self, music_dir='downloads'):
+    def __init__(self, music_dir='downloads', probe=None):
         self.music_dir = music_dir
         os.makedirs(music_dir, exist_ok=True)
+        self.index = DirectoryIndex(music_dir, suffixes=('.mp3', '.wav', '.flac'))
+        self.probe = probe or MediaProbe()
 
     def get_tracks(self):
-        return [
-            {
-                'title': file,
-                'path': os.path.join(self.music_dir, file)
-            } for file in os.listdir(self.music_dir) 
-            if file.endswith(('.mp3', '.wav', '.flac'))
-        ]
+        tracks = []
+        for file, (size, mtime) in sorted(self.index.files().items()):
+            path = os.path.join(self.music_dir, file)
+            info = self.probe.info(path, size, mtime)
+            tracks.append({
+                'title': info.get('tags', {}).get('title') or file,
+                'path': path,
+                **info
+            })
+        return tracks
+
+class SingleFlight:
+    """Runs one call per key at a time: callers arriving while it is in flight
+    wait for it and share its result or exception"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._calls
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'event': threading.Event(), 'value': None, 'error': None}
+
+        if not leader:
+            metrics.inc('audify_coalesced_calls_total')
+            call['event'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['value']
+
+        try:
+            call['value'] = func()
+            return call['value']
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['event'].set()
+
+class TTLCache:
+    """Thread-safe LRU cache with per-entry expiry and single-flight loading.
+    With stale_ttl, expired entries are still served for that long while a
+    background refresh replaces them."""
+    def __init__(self, max_entries=256, ttl=300, stale_ttl=0):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._flights = SingleFlight()
+        self._stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'loads': 0,
+                       'load_errors': 0, 'evictions': 0}
+
+    def _lookup(self, key):
+        """Return (value, fresh) for a usable entry, or (None, False)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, False
+            value, expires_at = entry
+            now = time.time()
+            if now >= expires_at + self.stale_ttl:
+                del self._entries[key]
+                return None, False
+            self._entries.move_to_end(key)
+            return value, now < expires_at
+
+    def get(self, key):
+        value, fresh = self._lookup(key)
+        return value if fresh else None
+
+    def set(self, key, value, expires_at=None):
+        if expires_at is None:
+            expires_at = time.time() + self.ttl
+        self._store(key, value, expires_at)
+        self._persist(key, value, expires_at)
+
+    def _store(self, key, value, expires_at):
+        """Insert into memory, evicting the least recently used entries"""
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['stale_hits'] + self._stats['misses']
+            return {
+                **self._stats,
+                'size': len(self._entries),
+                'hit_ratio': (self._stats['hits'] + self._stats['stale_hits']) / lookups if lookups else 0
+            }
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _persist(self, key, value, expires_at):
+        """Hook for caches that keep a copy outside memory"""
+
+    def _load_persisted(self, key):
+        """Hook returning (value, expires_at) from outside memory, or None"""
+        return None
+
+    def get_or_load(self, key, loader, expiry=None):
+        """Return the cached value or run loader once, sharing the result with
+        concurrent callers for the same key. None results are not cached."""
+        value, fresh = self._lookup(key)
+        if value is None:
+            persisted = self._load_persisted(key)
+            if persisted is not None and time.time() < persisted[1] + self.stale_ttl:
+                self._store(key, *persisted)
+                value, fresh = self._lookup(key)
+
+        if value is not None:
+            if fresh:
+                self._count('hits')
+            else:
+                self._count('stale_hits')
+                self._refresh(key, loader, expiry)
+            return value
+
+        self._count('misses')
+        return self._load(key, loader, expiry)
+
+    def _refresh(self, key, loader, expiry):
+        if self._flights.in_flight(key):
+            return
+
+        def refresh():
+            try:
+                self._load(key, loader, expiry)
+            except Exception as e:
+                print(f"Cache refresh error ({key}): {e}")
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def _load(self, key, loader, expiry):
+        def load():
+            try:
+                self._count('loads')
+                value = loader()
+            except Exception:
+                self._count('load_errors')
+                raise
+            if value is not None:
+                self.set(key, value, expiry(value) if expiry else None)
+            return value
+        return self._flights.do(key, load)
+
+class QueryCache(TTLCache):
+    """TTLCache for JSON-serialisable lookup results, mirrored to the app
+    database so warm entries survive restarts"""
+    def __init__(self, kind, max_entries=512, ttl=3600, stale_ttl=0, store=None):
+        super().__init__(max_entries, ttl, stale_ttl)
+        self.kind = kind
+        self.store = store
+
+    def _persist(self, key, value, expires_at):
+        if self.store is not None:
+            try:
+                self.store.save_cached_query(self.kind, key, value, expires_at, expires_at + self.stale_ttl)
+            except Exception as e:
+                print(f"Query cache write error: {e}")
+
+    def _load_persisted(self, key):
+        if self.store is None:
+            return None
+        try:
+            return self.store.load_cached_query(self.kind, key)
+        except Exception as e:
+            print(f"Query cache read error: {e}")
+            return None
+
+# yt_dlp is imported on first use or by the background warm-up: importing
+# it and building its extractors dominated start-up time
+yt_dlp = None
+_yt_dlp_lock = threading.Lock()
+
+def load_yt_dlp():
+    global yt_dlp
+    if yt_dlp is None:
+        with _yt_dlp_lock:
+            if yt_dlp is None:
+                import yt_dlp as module
+                yt_dlp = module
+    return yt_dlp
+
+class YoutubeDLPool:
+    """Process-wide pool of reusable YoutubeDL instances keyed by option profile"""
+    def __init__(self, max_per_profile=YTDL_POOL_SIZE):
+        self.max_per_profile = max(1, max_per_profile)
+        self._lock = threading.Lock()
+        self._profiles = {}
+        self._idle = {}
+        self._slots = {}
+
+    def register(self, name, opts):
+        """Register an option profile; re-registering an existing name is a no-op"""
+        with self._lock:
+            if name not in self._profiles:
+                self._profiles[name] = opts
+                self._idle[name] = []
+                self._slots[name] = threading.BoundedSemaphore(self.max_per_profile)
+
+    def warm(self, names=None, count=1):
+        """Pre-create idle instances so the first requests skip extractor setup"""
+        count = min(count, self.max_per_profile)
+        for name in names or list(self._profiles):
+            while len(self._idle[name]) < count:
+                try:
+                    ydl = load_yt_dlp().YoutubeDL(self._profiles[name])
+                except Exception as e:
+                    print(f"YoutubeDL warm-up error ({name}): {e}")
+                    break
+                with self._lock:
+                    if len(self._idle[name]) >= count:
+                        break
+                    self._idle[name].append(ydl)
+
+    @contextmanager
+    def checkout(self, name):
+        """Borrow an instance for the duration of the block, creating one if none is idle"""
+        slots = self._slots[name]
+        with metrics.timer('audify_ytdl_wait_seconds', profile=name):
+            slots.acquire()
+        try:
+            with self._lock:
+                ydl = self._idle[name].pop() if self._idle[name] else None
+            if ydl is None:
+                ydl = load_yt_dlp().YoutubeDL(self._profiles[name])
+            try:
+                with metrics.timer('audify_ytdl_extract_seconds', profile=name):
+                    yield ydl
+            finally:
+                with self._lock:
+                    self._idle[name].append(ydl)
+        finally:
+            slots.release()
+
+    def close(self):
+        with self._lock:
+            idle = [ydl for instances in self._idle.values() for ydl in instances]
+            for instances in self._idle.values():
+                instances.clear()
+        for ydl in idle:
+            try:
+                ydl.close()
+            except Exception:
+                pass
+
+ydl_pool = YoutubeDLPool()
+
+def _build_http_session():
+    """Keep-alive session shared by all upstream audio requests"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=PROXY_POOL_SIZE,
+                                            pool_maxsize=PROXY_POOL_SIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+http_session = _build_http_session()
+
+class SegmentCache:
+    """Disk cache of proxied audio. Each video is a sparse file filled in
+    fixed-size blocks; a JSON index records which blocks are present."""
+    def __init__(self, cache_dir, block_size=SEGMENT_BLOCK_SIZE, max_bytes=SEGMENT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.block_size = block_size
+        self.max_bytes = max_bytes
+        self.index_file = os.path.join(cache_dir, 'index.json')
+        self._lock = threading.Lock()
+        # Serialises index writes, which share one temporary file
+        self._save_lock = threading.Lock()
+        self._entries = {}
+        self._dirty = False
+        self._last_save = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+        atexit.register(self.save_index)
+
+    def _load_index(self):
+        try:
+            with open(self.index_file, 'r') as f:
+                data = json.load(f)
+        except:
+            data = {}
+
+        if data.get('block_size') != self.block_size:
+            # Blocks written with another size cannot be reused
+            for video_id in data.get('entries', {}):
+                self._remove_file(video_id)
+            return
+
+        for video_id, entry in data.get('entries', {}).items():
+            if os.path.exists(self.path(video_id)):
+                self._entries[video_id] = {
+                    'size': entry['size'],
+                    'content_type': entry['content_type'],
+                    'blocks': set(entry['blocks']),
+                    'last_access': entry['last_access']
+                }
+
+    def save_index(self):
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                data = {
+                    'block_size': self.block_size,
+                    'entries': {
+                        video_id: {
+                            'size': entry['size'],
+                            'content_type': entry['content_type'],
+                            'blocks': sorted(entry['blocks']),
+                            'last_access': entry['last_access']
+                        }
+                        for video_id, entry in self._entries.items()
+                    }
+                }
+                self._dirty = False
+                self._last_save = time.time()
+            try:
+                temp_file = self.index_file + '.tmp'
+                with metrics.timer('audify_persist_seconds', store='segment_index'):
+                    with open(temp_file, 'w') as f:
+                        json.dump(data, f)
+                    os.replace(temp_file, self.index_file)
+            except Exception as e:
+                print(f"Segment index save error: {e}")
+
+    def _maybe_save_index(self):
+        if time.time() - self._last_save >= SEGMENT_INDEX_SAVE_INTERVAL:
+            self.save_index()
+
+    def is_cacheable(self, video_id):
+        return re.fullmatch(r'[A-Za-z0-9_-]+', video_id) is not None
+
+    def path(self, video_id):
+        return os.path.join(self.cache_dir, f'{video_id}.bin')
+
+    def block_count(self, size):
+        return math.ceil(size / self.block_size)
+
+    def lookup(self, video_id):
+        """Return size, content type and completeness of a cached video, or None"""
+        with self._lock:
+            entry = self._entries.get(video_id)
+            if entry is None:
+                return None
+            entry['last_access'] = time.time()
+            self._dirty = True
+            return {
+                'size': entry['size'],
+                'content_type': entry['content_type'],
+                'complete': len(entry['blocks']) >= self.block_count(entry['size'])
+            }
+
+    def has_block(self, video_id, index):
+        with self._lock:
+            entry = self._entries.get(video_id)
+            return entry is not None and index in entry['blocks']
+
+    def next_cached_block(self, video_id, index, limit):
+        """First cached block at or after index and before limit, else limit"""
+        with self._lock:
+            entry = self._entries.get(video_id)
+            blocks = entry['blocks'] if entry else ()
+            while index < limit and index not in blocks:
+                index += 1
+            return index
+
+    def register(self, video_id, size, content_type):
+        """Start caching a video, discarding blocks of a different upstream file"""
+        with self._lock:
+            entry = self._entries.get(video_id)
+            if entry is not None and entry['size'] == size:
+                return
+            self._entries[video_id] = {
+                'size': size,
+                'content_type': content_type,
+                'blocks': set(),
+                'last_access': time.time()
+            }
+            self._dirty = True
+        self._remove_file(video_id)
+
+    def write_block(self, video_id, index, data):
+        with self._lock:
+            entry = self._entries.get(video_id)
+            if entry is None or index in entry['blocks']:
+                return
+        path = self.path(video_id)
+        try:
+            if not os.path.exists(path):
+                open(path, 'ab').close()
+            with open(path, 'r+b') as f:
+                f.seek(index * self.block_size)
+                f.write(data)
+        except OSError as e:
+            print(f"Segment cache write error: {e}")
+            return
+
+        with self._lock:
+            entry = self._entries.get(video_id)
+            if entry is None:
+                return
+            entry['blocks'].add(index)
+            entry['last_access'] = time.time()
+            self._dirty = True
+            complete = len(entry['blocks']) >= self.block_count(entry['size'])
+        self._evict(keep=video_id)
+        if complete:
+            self.save_index()
+        else:
+            self._maybe_save_index()
+
+    def read(self, video_id, start, end):
+        """Yield cached bytes start..end (inclusive) in relay-sized chunks"""
+        with open(self.path(video_id), 'rb') as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(PROXY_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def _evict(self, keep=None):
+        with self._lock:
+            used = sum(len(entry['blocks']) for entry in self._entries.values()) * self.block_size
+            if used <= self.max_bytes:
+                return
+            victims = []
+            for video_id, entry in sorted(self._entries.items(), key=lambda item: item[1]['last_access']):
+                if used <= self.max_bytes:
+                    break
+                if video_id == keep:
+                    continue
+                used -= len(entry['blocks']) * self.block_size
+                victims.append(video_id)
+            for video_id in victims:
+                del self._entries[video_id]
+            self._dirty = True
+        for video_id in victims:
+            self._remove_file(video_id)
+
+    def _remove_file(self, video_id):
+        try:
+            os.remove(self.path(video_id))
+        except OSError:
+            pass
 
 class YouTubeManager:
     def __init__(self):
-        self.app_data = AppDataManager()
+        self.app_data = get_app_data()
         self.base_opts = {
             'quiet': True,
             'no_warnings': True,
@@ -215,86 +1846,170 @@ class YouTubeManager:
             'skip_download': True,
         }
         
-        # Specific options for search
+        # Specific options for search; flat entries carry everything a result
+        # list needs, formats are only resolved when a track is played
         self.search_opts = {
             **self.base_opts,
-            'extract_flat': False,
+            'extract_flat': 'in_playlist',
         }
         
         # Specific options for related content
         self.related_opts = {
-            **self.base_opts,
-            'extract_flat': True,
-            'skip_download': True,
-            'playlistreverse': False,
+            'quiet': True,
+            'extract_flat': 'in_playlist',
+            'ignoreerrors': True,
+            'no_warnings': True,
+            'playlist_items': '1-11'
         }
 
-    def search(self, query):
-        with yt_dlp.YoutubeDL(self.search_opts) as ydl:
+        # Pooled download instances report progress to whichever callback
+        # the borrowing thread registered
+        self._progress = threading.local()
+        # One pooled profile per download profile, e.g. 'download:mp3'
+        self.download_opts = {}
+        for name, profile in DOWNLOAD_PROFILES.items():
+            opts = {
+                'format': profile['format'],
+                'outtmpl': os.path.join(self.app_data.downloads_dir, '%(title)s.%(ext)s'),
+                'postprocessors': [],
+                'progress_hooks': [self._dispatch_progress],
+                'postprocessor_hooks': [self._dispatch_postprocessor],
+            }
+            if profile['codec']:
+                opts['postprocessors'].append({
+                    'key': 'FFmpegExtractAudio',
+                    'preferredcodec': profile['codec'],
+                    'preferredquality': DOWNLOAD_AUDIO_QUALITY,
+                })
+            self.download_opts[name] = opts
+
+        ydl_pool.register('search', self.search_opts)
+        ydl_pool.register('stream', self.stream_opts)
+        ydl_pool.register('related', self.related_opts)
+        for name, opts in self.download_opts.items():
+            ydl_pool.register(f'download:{name}', opts)
+
+        # Resolved formats shared by /api/stream and /api/proxy
+        self.stream_cache = TTLCache(STREAM_CACHE_SIZE, STREAM_DEFAULT_TTL)
+
+        # Search and related results; stale entries are served for one more
+        # TTL while they refresh in the background
+        store = self.app_data if QUERY_CACHE_PERSIST else None
+        self.search_cache = QueryCache('search', QUERY_CACHE_SIZE, SEARCH_CACHE_TTL,
+                                       SEARCH_CACHE_TTL, store)
+        self.related_cache = QueryCache('related', QUERY_CACHE_SIZE, RELATED_CACHE_TTL,
+                                        RELATED_CACHE_TTL, store)
+
+    def search(self, query, limit=1, offset=0):
+        """Return one page of flat search results"""
+        limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+        offset = max(0, min(offset, SEARCH_MAX_DEPTH - limit))
+        key = f"{' '.join(query.lower().split())}|{limit}|{offset}"
+        # Empty results are not cached, so failed searches are retried
+        return self.search_cache.get_or_load(
+            key, lambda: self._search(query, limit, offset) or None
+        ) or []
+
+    def _search(self, query, limit, offset):
+        with ydl_pool.checkout('search') as ydl:
             try:
-                # Only fetch one result initially for faster response
-                results = ydl.extract_info(f"ytsearch1:{query}", download=False)
+                results = ydl.extract_info(f"ytsearch{offset + limit}:{query}", download=False)
                 return [{
                     'id': entry.get('id', ''),
                     'title': entry.get('title', 'Unknown Title'),
-                    'uploader': entry.get('uploader', 'Unknown Artist'),
-                    'thumbnails': entry.get('thumbnails', [{'url': '/static/default-thumbnail.png'}]),
-                    'duration': entry.get('duration', 0)
-                } for entry in results['entries']]
+                    'uploader': entry.get('uploader') or entry.get('channel') or 'Unknown Artist',
+                    'thumbnails': entry.get('thumbnails') or [{'url': '/static/default-thumbnail.png'}],
+                    'duration': entry.get('duration') or 0
+                } for entry in list(results['entries'])[offset:offset + limit] if entry]
             except Exception as e:
                 print(f"Search error: {e}")
                 return []
 
     def get_related(self, video_id):
-        ydl_opts = {
-            'quiet': True,
-            'extract_flat': 'in_playlist',
-            'ignoreerrors': True,
-            'no_warnings': True,
-            'playlist_items': '1-11'
-        }
-        
+        return self.related_cache.get_or_load(
+            video_id, lambda: self._get_related(video_id) or None
+        ) or []
+
+    def _get_related(self, video_id):
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            with ydl_pool.checkout('related') as ydl:
                 related_results = ydl.extract_info(
                     f"https://www.youtube.com/watch?v={video_id}&list=RD{video_id}",
                     download=False
                 )
-                
-                if related_results and 'entries' in related_results:
-                    related = []
-                    current_title = None
-                    
-                    # Get current video title for comparison
-                    try:
-                        current_info = ydl.extract_info(f"https://youtube.com/watch?v={video_id}", 
-                                                      download=False)
-                        current_title = current_info.get('title', '').lower()
-                    except:
-                        pass
-
-                    # Filter out duplicates by title
-                    seen_titles = {current_title} if current_title else set()
-                    
-                    for entry in related_results['entries'][1:11]:
-                        if entry:
-                            title = entry.get('title', '').lower()
-                            if title not in seen_titles:
-                                seen_titles.add(title)
-                                related.append({
-                                    'id': entry.get('id', ''),
-                                    'title': entry.get('title', 'Unknown Title'),
-                                    'uploader': entry.get('uploader', 'Unknown Artist'),
-                                    'thumbnails': entry.get('thumbnails', [{'url': '/static/default-thumbnail.png'}]),
-                                    'duration': self.format_duration(entry.get('duration', 0))
-                                })
-                    return related
-                return []
-                
         except Exception as e:
             print(f"Related videos error: {str(e)}")
             return []
 
+        if not related_results or 'entries' not in related_results:
+            return []
+        entries = [entry for entry in related_results['entries'] if entry]
+
+        # Filter out duplicates by title, starting with the seed video's own
+        seed_title = self._seed_title(video_id, entries)
+        seen_titles = {self.normalize_title(seed_title)} if seed_title else set()
+
+        related = []
+        for entry in entries:
+            if entry.get('id') == video_id:
+                continue
+            title = self.normalize_title(entry.get('title') or '')
+            if title in seen_titles:
+                continue
+            seen_titles.add(title)
+            related.append({
+                'id': entry.get('id', ''),
+                'title': entry.get('title', 'Unknown Title'),
+                'uploader': entry.get('uploader', 'Unknown Artist'),
+                'thumbnails': entry.get('thumbnails', [{'url': '/static/default-thumbnail.png'}]),
+                'duration': self.format_duration(entry.get('duration', 0))
+            })
+            if len(related) >= 10:
+                break
+
+        try:
+            self.app_data.record_related(video_id, related)
+        except Exception as e:
+            print(f"Failed to record related tracks: {e}")
+        return related
+
+    def _seed_title(self, video_id, entries):
+        """Title of the mix's seed video without another extraction: the mix
+        normally starts with it, otherwise use what we already know about it"""
+        for entry in entries:
+            if entry.get('id') == video_id and entry.get('title'):
+                return entry['title']
+        stream = self.stream_cache.get(video_id)
+        if stream:
+            return stream.get('title')
+        track = self.app_data.get_track(video_id)
+        if track:
+            return track.get('title')
+        return None
+
+    @staticmethod
+    def normalize_title(title):
+        """Lower-case a title and drop decorations such as '(Official Video)'
+        or '[Lyrics]' so re-uploads of the same song compare equal. Titles
+        that are nothing but decoration keep their lower-cased text.
+
+        >>> YouTubeManager.normalize_title('Song (Official Video)')
+        'song'
+        >>> YouTubeManager.normalize_title('Song - Official Audio')
+        'song'
+        >>> YouTubeManager.normalize_title('Lyrics Song')
+        'lyrics song'
+        >>> YouTubeManager.normalize_title('The Lyrics Of Love')
+        'the lyrics of love'
+        >>> YouTubeManager.normalize_title('Lyrics')
+        'lyrics'
+        """
+        raw = title.lower()
+        title = TITLE_DECORATION_PATTERN.sub(' ', raw)
+        title = TITLE_SUFFIX_PATTERN.sub(' ', title)
+        title = re.sub(r'[^\w\s]', ' ', title)
+        return ' '.join(title.split()) or ' '.join(raw.split())
+
     def format_duration(self, duration):
         if duration is None:
             return "Unknown"
@@ -306,8 +2021,32 @@ class YouTubeManager:
             return "Unknown"
 
     def get_stream_url(self, video_id):
+        return self.public_stream(self.resolve_stream(video_id))
+
+    def cached_stream_url(self, video_id):
+        """Like get_stream_url, but only from a fresh cache entry; never extracts"""
+        return self.public_stream(self.stream_cache.get(video_id))
+
+    @staticmethod
+    def public_stream(stream):
+        if not stream:
+            return None
+        return {
+            key: value for key, value in stream.items()
+            if key not in ('http_headers', 'expires_at')
+        }
+
+    def resolve_stream(self, video_id):
+        """Resolve the best audio format, reusing cached and in-flight extractions"""
+        return self.stream_cache.get_or_load(
+            video_id,
+            lambda: self._extract_stream(video_id),
+            expiry=lambda stream: stream['expires_at'] - STREAM_EXPIRY_MARGIN
+        )
+
+    def _extract_stream(self, video_id):
         try:
-            with yt_dlp.YoutubeDL(self.stream_opts) as ydl:
+            with ydl_pool.checkout('stream') as ydl:
                 info = ydl.extract_info(f"https://youtube.com/watch?v={video_id}", download=False)
                 
                 # Get the best audio format
@@ -338,7 +2077,10 @@ class YouTubeManager:
                         'duration': info.get('duration', 0),
                         'thumbnail': info.get('thumbnail', ''),
                         'uploader': info.get('uploader', 'Unknown Artist'),
-                        'format': best_audio.get('ext', '')
+                        'format': best_audio.get('ext', ''),
+                        'abr': best_audio.get('abr'),
+                        'http_headers': best_audio.get('http_headers', {}),
+                        'expires_at': self._parse_url_expiry(best_audio['url'])
                     }
                 
                 return None
@@ -346,34 +2088,772 @@ class YouTubeManager:
             print(f"Stream URL error: {str(e)}")
             return None
 
-    def download_track(self, video_id, progress_callback=None):
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'outtmpl': os.path.join(self.app_data.downloads_dir, '%(title)s.%(ext)s'),
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-            }]
-        }
-        
-        try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(f"https://youtube.com/watch?v={video_id}", download=True)
-                filename = ydl.prepare_filename(info).rsplit(".", 1)[0] + ".mp3"
-                
-                # Save download metadata
-                self.app_data.save_download_info({
-                    'id': video_id,
-                    'title': info.get('title'),
-                    'uploader': info.get('uploader'),
-                    'thumbnail': info.get('thumbnail'),
-                    'filename': os.path.basename(filename)
-                })
-                
-                return os.path.basename(filename)
-        except Exception as e:
-            print(f"Download error: {e}")
-            return None
+    def _parse_url_expiry(self, url):
+        """Read the expiry timestamp embedded in a signed googlevideo URL"""
+        try:
+            expire = parse_qs(urlparse(url).query).get('expire')
+            if expire:
+                return float(expire[0])
+            match = re.search(r'/expire/(\d+)', url)
+            if match:
+                return float(match.group(1))
+        except ValueError:
+            pass
+        return time.time() + STREAM_DEFAULT_TTL
+
+    def _dispatch_progress(self, status):
+        callback = getattr(self._progress, 'callback', None)
+        if callback:
+            callback(status)
+
+    def _dispatch_postprocessor(self, status):
+        callback = getattr(self._progress, 'callback', None)
+        if callback and status.get('status') == 'started':
+            callback({'status': 'postprocessing', 'postprocessor': status.get('postprocessor')})
+
+    def download_track(self, video_id, progress_callback=None, profile=None):
+        """Download a track using one of DOWNLOAD_PROFILES (default
+        DOWNLOAD_PROFILE). progress_callback receives yt-dlp progress dicts
+        plus {'status': 'postprocessing'} when conversion starts."""
+        profile = profile or DOWNLOAD_PROFILE
+        codec = DOWNLOAD_PROFILES[profile]['codec']
+        self._progress.callback = progress_callback
+        try:
+            with ydl_pool.checkout(f'download:{profile}') as ydl:
+                info = ydl.extract_info(f"https://youtube.com/watch?v={video_id}", download=True)
+                # The final path after any postprocessing
+                requested = info.get('requested_downloads') or [{}]
+                filename = requested[0].get('filepath')
+                if not filename:
+                    filename = ydl.prepare_filename(info)
+                    if codec:
+                        filename = filename.rsplit(".", 1)[0] + "." + codec
+
+                # Save download metadata
+                self.app_data.save_download_info({
+                    'id': video_id,
+                    'title': info.get('title'),
+                    'uploader': info.get('uploader'),
+                    'thumbnail': info.get('thumbnail'),
+                    'filename': os.path.basename(filename),
+                    'codec': codec or info.get('acodec')
+                })
+                
+                return os.path.basename(filename)
+        except Exception as e:
+            print(f"Download error: {e}")
+            return None
+        finally:
+            self._progress.callback = None
+
+class EventBus:
+    """Publish/subscribe hub for job state. Publishers store the latest state
+    per topic; subscribers block on a condition variable until something
+    changes and receive only the changed fields."""
+    def __init__(self, history=1000, topics_kept=500):
+        self.topics_kept = topics_kept
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=history)
+        self._states = OrderedDict()
+        self._seq = 0
+        self._wakers = set()
+
+    @property
+    def seq(self):
+        with self._cond:
+            return self._seq
+
+    def publish(self, topic, state, event='update'):
+        with self._cond:
+            previous = self._states.get(topic, {})
+            delta = {
+                key: value for key, value in state.items()
+                if key not in previous or previous[key] != value
+            }
+            if not delta and event == 'update':
+                return
+            self._states[topic] = dict(state)
+            self._states.move_to_end(topic)
+            while len(self._states) > self.topics_kept:
+                self._states.popitem(last=False)
+            self._seq += 1
+            self._events.append((self._seq, topic, event, delta))
+            self._cond.notify_all()
+            for wake in self._wakers:
+                wake()
+
+    def state(self, topic):
+        with self._cond:
+            return dict(self._states.get(topic, {}))
+
+    def snapshot(self):
+        with self._cond:
+            return [(topic, dict(state)) for topic, state in self._states.items()]
+
+    def wait(self, after, timeout=SSE_HEARTBEAT):
+        """Events published after sequence number 'after', waiting up to timeout"""
+        with self._cond:
+            if self._seq <= after:
+                self._cond.wait(timeout)
+            return [event for event in self._events if event[0] > after]
+
+    async def wait_async(self, after, timeout=SSE_HEARTBEAT):
+        """Coroutine version of wait() for subscribers on an event loop"""
+        loop = asyncio.get_running_loop()
+        changed = asyncio.Event()
+
+        def wake():
+            loop.call_soon_threadsafe(changed.set)
+
+        with self._cond:
+            if self._seq > after:
+                return [event for event in self._events if event[0] > after]
+            self._wakers.add(wake)
+        try:
+            await asyncio.wait_for(changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._cond:
+                self._wakers.discard(wake)
+        with self._cond:
+            return [event for event in self._events if event[0] > after]
+
+event_bus = EventBus()
+
+def sse_message(data, event=None, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    if event:
+        lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+def topic_matcher(topics):
+    """Match a topic exactly or by kind, e.g. 'download' or 'download:<video_id>'"""
+    def matches(topic):
+        return not topics or any(topic == t or topic.startswith(t + ':') for t in topics)
+    return matches
+
+def sse_response(generator):
+    return Response(
+        stream_with_context(generator),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+class RecommendationEngine:
+    """Serves recommendations from a ranked list precomputed out of the
+    related-track graph recorded in the app database. A background thread
+    rebuilds the list periodically and shortly after new signals arrive."""
+    def __init__(self, app_data, yt):
+        self.app_data = app_data
+        self.yt = yt
+        self._lock = threading.Lock()
+        self._ranked = []
+        self._refreshed = False
+        self._dirty = threading.Event()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def mark_dirty(self):
+        self._dirty.set()
+
+    def recommendations(self, limit=10, offset=0):
+        with self._lock:
+            if self._refreshed:
+                return self._ranked[offset:offset + limit]
+        # The first background refresh is still running: rank what is stored
+        return self.app_data.rank_candidates(offset + limit)[offset:]
+
+    def refresh(self, expansions=RECOMMENDATION_EXPANSIONS):
+        try:
+            if not self.app_data.rank_candidates(1):
+                self._seed_from_history()
+            for track_id in self.app_data.seeds_without_related(expansions):
+                try:
+                    related = self.yt.get_related(track_id)
+                except Exception as e:
+                    print(f"Related lookup failed for {track_id}: {e}")
+                    related = None
+                if not related:
+                    self.app_data.record_related_failure(track_id)
+            ranked = self.app_data.rank_candidates(RECOMMENDATION_LIMIT)
+            with self._lock:
+                self._ranked = ranked
+                self._refreshed = True
+        except Exception as e:
+            logging.error(f"Recommendation refresh failed: {e}")
+
+    def _seed_from_history(self):
+        """Search history predates track activity; turn recent queries into seeds"""
+        for query in self.app_data._load_search_history()[-RECOMMENDATION_EXPANSIONS:]:
+            results = self.yt.search(query)
+            if results:
+                self.app_data.record_activity(results[0]['id'], 'searches')
+
+    def _run(self):
+        # Rank and expand once at start-up, then on signals or periodically
+        self.refresh()
+        while True:
+            if self._dirty.wait(RECOMMENDATION_REFRESH_INTERVAL):
+                # Let bursts of signals (e.g. a playlist import) settle first
+                time.sleep(2)
+            self._dirty.clear()
+            self.refresh()
+
+class DownloadJob:
+    """State of one queued, running or finished track download"""
+    def __init__(self, video_id, priority=0, profile=None):
+        self.id = str(uuid.uuid4())
+        self.kind = 'download'
+        self.video_id = video_id
+        self.priority = priority
+        self.profile = profile or DOWNLOAD_PROFILE
+        self.status = 'queued'
+        self.bytes_done = 0
+        self.bytes_total = None
+        self.speed = None
+        self.eta = None
+        self.filename = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.done = threading.Event()
+        self.cancel_requested = False
+        # Batches this job is part of, republished when it changes
+        self.batches = []
+        self._published = None
+
+    @property
+    def topic(self):
+        return f'{self.kind}:{self.video_id}'
+
+    @property
+    def progress(self):
+        """Fraction downloaded; only a completed download reaches 1, so
+        failed and cancelled jobs keep the share they got through"""
+        if self.status == 'done':
+            return 1
+        if self.bytes_total:
+            return min(self.bytes_done / self.bytes_total, 0.99)
+        return 0
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'video_id': self.video_id,
+            'priority': self.priority,
+            'profile': self.profile,
+            'status': self.status,
+            'progress': self.progress,
+            'bytes_done': self.bytes_done,
+            'bytes_total': self.bytes_total,
+            'speed': self.speed,
+            'eta': self.eta,
+            'filename': self.filename,
+            'error': self.error,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at
+        }
+
+class BatchDownload:
+    """A group of download jobs started together, e.g. for a playlist, with
+    aggregate progress and pause/resume/cancel of the whole group"""
+    def __init__(self, manager, playlist_id=None):
+        self.id = str(uuid.uuid4())
+        self.kind = 'batch'
+        self.manager = manager
+        self.playlist_id = playlist_id
+        self.status = 'running'
+        self.jobs = OrderedDict()
+        self.skipped = []
+        # Jobs created by this batch; jobs it joined are not paused or cancelled
+        self.owned = set()
+        self.created_at = time.time()
+        self.finished_at = None
+        # Reentrant: pause/resume/cancel hold it while the job updates they
+        # cause publish the batch again
+        self._lock = threading.RLock()
+        self._published = None
+
+    @property
+    def topic(self):
+        return f'{self.kind}:{self.id}'
+
+    @property
+    def total(self):
+        return len(self.jobs) + len(self.skipped)
+
+    @property
+    def progress(self):
+        if not self.total:
+            return 1
+        return (len(self.skipped) + sum(job.progress for job in self.jobs.values())) / self.total
+
+    def count(self, status):
+        return sum(1 for job in self.jobs.values() if job.status == status)
+
+    def to_dict(self):
+        # publish() holds the lock too; submit_batch fills jobs under it
+        with self._lock:
+            return {
+                'id': self.id,
+                'kind': self.kind,
+                'playlist_id': self.playlist_id,
+                'status': self.status,
+                'progress': self.progress,
+                'total': self.total,
+                'skipped': len(self.skipped),
+                'completed': self.count('done'),
+                'failed': self.count('failed'),
+                'cancelled': self.count('cancelled'),
+                'tracks': {
+                    video_id: {'status': job.status, 'progress': round(job.progress, 2)}
+                    for video_id, job in self.jobs.items()
+                },
+                'created_at': self.created_at,
+                'finished_at': self.finished_at
+            }
+
+    def publish(self):
+        with self._lock:
+            if self.status in ('running', 'paused') and all(job.finished_at for job in self.jobs.values()):
+                self.status = 'done'
+                self.finished_at = time.time()
+            state = self.to_dict()
+            key = (state['status'], int(state['progress'] * 100),
+                   tuple(track['status'] for track in state['tracks'].values()))
+            if key == self._published:
+                return
+            self._published = key
+        event = state['status'] if state['status'] in ('done', 'cancelled') else 'update'
+        event_bus.publish(self.topic, state, event)
+
+    def owned_jobs(self):
+        return [job for video_id, job in self.jobs.items() if video_id in self.owned]
+
+    def pause(self):
+        """Stop queued tracks from starting; running ones finish"""
+        with self._lock:
+            if self.status != 'running':
+                return False
+            self.status = 'paused'
+            for job in self.owned_jobs():
+                self.manager.pause(job)
+            self.publish()
+            return True
+
+    def resume(self):
+        with self._lock:
+            if self.status != 'paused':
+                return False
+            self.status = 'running'
+            for job in self.owned_jobs():
+                self.manager.resume(job)
+            self.publish()
+            return True
+
+    def cancel(self):
+        with self._lock:
+            if self.status not in ('running', 'paused'):
+                return False
+            self.status = 'cancelled'
+            self.finished_at = time.time()
+            for job in self.owned_jobs():
+                self.manager.cancel(job)
+            self.publish()
+            return True
+
+class DownloadManager:
+    """Runs downloads on a bounded worker pool, highest priority first, with
+    at most one job per video in flight"""
+    def __init__(self, workers=DOWNLOAD_WORKERS):
+        self.workers = max(1, workers)
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._active = {}
+        self._held = {}
+        self._batches = OrderedDict()
+        self._threads = []
+
+    def submit(self, video_id, priority=0, profile=None):
+        """Queue a download, or return the job already queued or running for it"""
+        if profile is not None and profile not in DOWNLOAD_PROFILES:
+            raise ValueError(f'Unknown download profile: {profile}')
+        with self._lock:
+            job = self._active.get(video_id)
+            if job is not None:
+                return job
+            job = DownloadJob(video_id, priority, profile)
+            self._jobs[job.id] = job
+            self._active[video_id] = job
+            self._start_workers()
+        self._publish(job)
+        self._queue.put((-priority, next(self._order), job))
+        return job
+
+    def submit_batch(self, video_ids, priority=0, profile=None, skip=(), playlist_id=None):
+        """Queue downloads for several videos at once as one BatchDownload.
+        Videos in 'skip' (already downloaded) count as complete."""
+        if profile is not None and profile not in DOWNLOAD_PROFILES:
+            raise ValueError(f'Unknown download profile: {profile}')
+        batch = BatchDownload(self, playlist_id)
+        with batch._lock:
+            for video_id in dict.fromkeys(video_ids):
+                if video_id in skip:
+                    batch.skipped.append(video_id)
+                    continue
+                with self._lock:
+                    existing = self._active.get(video_id)
+                job = existing or self.submit(video_id, priority, profile)
+                if existing is None:
+                    batch.owned.add(video_id)
+                batch.jobs[video_id] = job
+        # Attached only once complete, so a job finishing meanwhile can't
+        # publish a half-built batch as done
+        for job in batch.jobs.values():
+            job.batches.append(batch)
+        with self._lock:
+            self._batches[batch.id] = batch
+            finished = [batch_id for batch_id, b in self._batches.items() if b.finished_at]
+            for batch_id in finished[:max(0, len(finished) - FINISHED_JOBS_KEPT)]:
+                del self._batches[batch_id]
+        batch.publish()
+        return batch
+
+    def get_batch(self, batch_id):
+        with self._lock:
+            return self._batches.get(batch_id)
+
+    def pause(self, job):
+        """Keep a queued job from starting until resume()"""
+        with self._lock:
+            if job.status != 'queued':
+                return
+            job.status = 'paused'
+        self._publish(job)
+
+    def resume(self, job):
+        with self._lock:
+            if job.status != 'paused':
+                return
+            job.status = 'queued'
+            held = self._held.pop(job.id, None)
+        if held is not None:
+            self._queue.put((-job.priority, next(self._order), job))
+        self._publish(job)
+
+    def cancel(self, job):
+        """Drop a queued or paused job; a running one stops at its next
+        progress update"""
+        with self._lock:
+            if job.finished_at:
+                return
+            job.cancel_requested = True
+            waiting = job.status in ('queued', 'paused')
+            if waiting:
+                # Workers skip finished jobs they pop from the queue
+                job.finished_at = time.time()
+            self._held.pop(job.id, None)
+        if waiting:
+            self._finish(job, cancelled=True)
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def find(self, video_id):
+        with self._lock:
+            return self._active.get(video_id)
+
+    def latest(self, video_id):
+        """The active job for a track, else its most recent finished one"""
+        with self._lock:
+            job = self._active.get(video_id)
+            if job is None:
+                jobs = [job for job in self._jobs.values() if job.video_id == video_id]
+                job = max(jobs, key=lambda job: job.created_at, default=None)
+            return job
+
+    def list_jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _start_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            _, _, job = self._queue.get()
+            with self._lock:
+                if job.finished_at:
+                    continue
+                if job.status == 'paused':
+                    # Parked until resume() puts it back on the queue
+                    self._held[job.id] = job
+                    continue
+                job.status = 'downloading'
+            try:
+                self._run(job)
+            except Exception as e:
+                if job.cancel_requested:
+                    self._finish(job, cancelled=True)
+                else:
+                    logging.error(f"Download job {job.id} failed: {e}")
+                    self._finish(job, error=str(e))
+
+    def _publish(self, job):
+        # Byte counters change on every hook call; only publish when the
+        # status or whole-percent progress moves
+        key = (job.status, int(job.progress * 100))
+        if key == job._published:
+            return
+        job._published = key
+        event = job.status if job.status in ('done', 'failed', 'cancelled') else 'update'
+        event_bus.publish(job.topic, job.to_dict(), event)
+        for batch in job.batches:
+            batch.publish()
+
+    def _run(self, job):
+        self._publish(job)
+        filename = get_youtube_manager().download_track(
+            job.video_id, lambda status: self._on_progress(job, status), job.profile
+        )
+        if filename:
+            self._finish(job, filename=filename)
+            get_recommendation_engine().mark_dirty()
+        elif job.cancel_requested:
+            self._finish(job, cancelled=True)
+        else:
+            self._finish(job, error='Failed to download track')
+
+    def _on_progress(self, job, status):
+        if job.cancel_requested:
+            # Raised inside yt-dlp's progress hook, which aborts the download
+            raise load_yt_dlp().utils.DownloadCancelled('Cancelled')
+        if status.get('status') == 'downloading':
+            job.bytes_done = status.get('downloaded_bytes') or 0
+            job.bytes_total = status.get('total_bytes') or status.get('total_bytes_estimate')
+            job.speed = status.get('speed')
+            job.eta = status.get('eta')
+        elif status.get('status') in ('finished', 'postprocessing'):
+            job.status = 'postprocessing'
+            if job.bytes_total:
+                job.bytes_done = job.bytes_total
+            job.eta = 0
+        self._publish(job)
+
+    def _finish(self, job, filename=None, error=None, cancelled=False):
+        job.filename = filename
+        job.error = error
+        job.status = 'cancelled' if cancelled else ('failed' if error else 'done')
+        job.finished_at = time.time()
+        with self._lock:
+            if self._active.get(job.video_id) is job:
+                del self._active[job.video_id]
+            self._prune()
+        self._publish(job)
+        job.done.set()
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished_at]
+        for job_id in finished[:max(0, len(finished) - FINISHED_JOBS_KEPT)]:
+            del self._jobs[job_id]
+
+# Shared managers, created on first use and reused by every request
+_shared_lock = threading.RLock()
+_app_data = None
+_youtube_manager = None
+_segment_cache = None
+_download_manager = None
+_recommendation_engine = None
+_prefetcher = None
+_music_manager = None
+_request_profiler = None
+_stream_batch_executor = None
+
+def get_app_data():
+    global _app_data
+    if _app_data is None:
+        with _shared_lock:
+            if _app_data is None:
+                _app_data = AppDataManager()
+    return _app_data
+
+def get_youtube_manager():
+    global _youtube_manager
+    if _youtube_manager is None:
+        with _shared_lock:
+            if _youtube_manager is None:
+                _youtube_manager = YouTubeManager()
+    return _youtube_manager
+
+def get_segment_cache():
+    global _segment_cache
+    if _segment_cache is None:
+        with _shared_lock:
+            if _segment_cache is None:
+                _segment_cache = SegmentCache(get_app_data().stream_cache_dir)
+    return _segment_cache
+
+def get_download_manager():
+    global _download_manager
+    if _download_manager is None:
+        with _shared_lock:
+            if _download_manager is None:
+                _download_manager = DownloadManager()
+    return _download_manager
+
+def get_recommendation_engine():
+    global _recommendation_engine
+    if _recommendation_engine is None:
+        with _shared_lock:
+            if _recommendation_engine is None:
+                _recommendation_engine = RecommendationEngine(get_app_data(), get_youtube_manager())
+                _recommendation_engine.start()
+    return _recommendation_engine
+
+def get_prefetcher():
+    global _prefetcher
+    if _prefetcher is None:
+        with _shared_lock:
+            if _prefetcher is None:
+                _prefetcher = Prefetcher()
+    return _prefetcher
+
+def get_request_profiler():
+    global _request_profiler
+    if _request_profiler is None:
+        with _shared_lock:
+            if _request_profiler is None:
+                _request_profiler = RequestProfiler(
+                    os.path.join(get_app_data().app_data_dir, 'profiles')
+                )
+    return _request_profiler
+
+def get_stream_batch_executor():
+    global _stream_batch_executor
+    if _stream_batch_executor is None:
+        with _shared_lock:
+            if _stream_batch_executor is None:
+                _stream_batch_executor = ThreadPoolExecutor(
+                    max_workers=max(1, STREAM_BATCH_WORKERS), thread_name_prefix='audify-resolve'
+                )
+    return _stream_batch_executor
+
+def get_music_manager():
+    global _music_manager
+    if _music_manager is None:
+        with _shared_lock:
+            if _music_manager is None:
+                _music_manager = MusicManager(probe=get_app_data().media_probe)
+    return _music_manager
+
+# Serialised listings keyed by the state they were built from
+_listing_cache = {}
+
+def cached_json_listing(name, state, build):
+    """JSON response for a listing that only changes when 'state' does, with
+    a content ETag so unchanged listings are answered with 304"""
+    cached = _listing_cache.get(name)
+    if cached is None or cached[0] != state:
+        body = json.dumps(build()).encode()
+        cached = (state, body, hashlib.sha1(body).hexdigest())
+        _listing_cache[name] = cached
+    response = Response(cached[1], mimetype='application/json')
+    response.set_etag(cached[2])
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+def _json_object():
+    """The request's JSON body as a dict ({} without one), or None when the
+    body is JSON but not an object"""
+    data = request.get_json(silent=True)
+    if data is None:
+        return {}
+    return data if isinstance(data, dict) else None
+
+def serve_indexed_file(index, filename, as_attachment=False):
+    """Send a file listed in a DirectoryIndex with a strong ETag built from
+    its size and mtime. Conditional and Range requests are answered from
+    that (304/206), and the body is optionally handed to a reverse proxy."""
+    file_path = safe_join(index.path, filename)
+    files = index.files()
+    if file_path is None or filename not in files:
+        # The file may have been written since the last check
+        index.refresh()
+        files = index.files()
+        if file_path is None or filename not in files:
+            return jsonify({'error': 'File not found'}), 404
+
+    size, mtime = files[filename]
+    etag = hashlib.sha1(f'{filename}:{size}:{mtime}'.encode()).hexdigest()
+    extension = os.path.splitext(filename)[1].lower()
+    mimetype = (LOCAL_AUDIO_TYPES.get(extension) or mimetypes.guess_type(filename)[0]
+                or 'application/octet-stream')
+
+    if LOCAL_FILE_OFFLOAD in ('x-sendfile', 'x-accel'):
+        response = Response(mimetype=mimetype)
+        if LOCAL_FILE_OFFLOAD == 'x-sendfile':
+            response.headers['X-Sendfile'] = os.path.abspath(file_path)
+        else:
+            response.headers['X-Accel-Redirect'] = LOCAL_ACCEL_PREFIX + quote(filename)
+        if as_attachment:
+            response.headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(filename)}"
+        response.set_etag(etag)
+        response.last_modified = mtime
+        response.cache_control.private = True
+        response.cache_control.max_age = LOCAL_FILE_MAX_AGE
+        return response.make_conditional(request)
+
+    response = send_file(
+        file_path, mimetype=mimetype, as_attachment=as_attachment,
+        etag=etag, last_modified=mtime, max_age=LOCAL_FILE_MAX_AGE, conditional=True
+    )
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
+
+# Reported by /api/health
+_started_at = time.time()
+_warmed_up = threading.Event()
+
+def warm_up():
+    """Create the shared managers and pre-warm the YoutubeDL pool"""
+    try:
+        get_youtube_manager()
+        get_recommendation_engine()
+        ydl_pool.warm(['search', 'stream', 'related'])
+    except Exception as e:
+        print(f"Warm-up error: {e}")
+    finally:
+        _warmed_up.set()
+
+@app.route('/api/health')
+def health():
+    """Answers as soon as the server is listening. ?ready=warm answers 503
+    until yt-dlp is loaded and the pool is warm."""
+    warm = _warmed_up.is_set()
+    status = 503 if request.args.get('ready') == 'warm' and not warm else 200
+    return jsonify({
+        'status': 'ok' if status == 200 else 'warming',
+        'warm': warm,
+        'yt_dlp_loaded': yt_dlp is not None,
+        'uptime': round(time.time() - _started_at, 3)
+    }), status
 
 @app.route('/')
 def index():
@@ -381,40 +2861,257 @@ def index():
 
 @app.route('/tracks')
 def list_tracks():
-    music_manager = MusicManager()
-    return jsonify(music_manager.get_tracks())
+    music_manager = get_music_manager()
+    music_manager.index.files()
+    return cached_json_listing('tracks', music_manager.index.version, music_manager.get_tracks)
 
 @app.route('/download/<filename>')
 def download_track(filename):
-    music_manager = MusicManager()
-    filepath = os.path.join(music_manager.music_dir, filename)
-    return send_file(filepath, as_attachment=True)
+    return serve_indexed_file(get_music_manager().index, filename, as_attachment=True)
 
 @app.route('/api/search')
 def search():
     query = request.args.get('q', '')
-    yt = YouTubeManager()
-    results = yt.search(query)
+    limit = request.args.get('limit', 1, type=int)
+    offset = request.args.get('offset', 0, type=int)
+    if offset + max(1, min(limit, SEARCH_MAX_LIMIT)) > SEARCH_MAX_DEPTH:
+        return jsonify({'error': f'Results are only available up to {SEARCH_MAX_DEPTH} deep'}), 400
+    yt = get_youtube_manager()
+    results = yt.search(query, limit, offset)
     
     # Save search query
-    if results and len(results) > 0:
-        app_data = AppDataManager()
+    if results and offset == 0:
+        app_data = get_app_data()
         app_data.add_search_query(query)
+        app_data.record_candidates(results)
+        app_data.record_activity(results[0]['id'], 'searches')
+        get_recommendation_engine().mark_dirty()
     
     return jsonify(results)
 
 @app.route('/api/related/<video_id>')
 def related(video_id):
-    yt = YouTubeManager()
+    yt = get_youtube_manager()
     results = yt.get_related(video_id)
     return jsonify(results)
 
+class RequestProfiler:
+    """Statistical profiler for request threads. One background thread samples
+    the stacks of every registered thread each PROFILE_SAMPLE_INTERVAL, so
+    the request itself pays only for registering. Profiles of requests over
+    PROFILE_SLOW_MS are written as collapsed stacks (one 'a;b;c count' line
+    per stack, as read by flamegraph.pl and speedscope) with a JSON summary."""
+    def __init__(self, profiles_dir, interval=PROFILE_SAMPLE_INTERVAL, kept=PROFILES_KEPT):
+        self.profiles_dir = profiles_dir
+        self.interval = interval
+        self.kept = kept
+        os.makedirs(profiles_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._active = {}
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._sample_loop, daemon=True)
+        self._thread.start()
+
+    def start(self):
+        with self._lock:
+            self._active[threading.get_ident()] = {}
+        self._wake.set()
+
+    def stop(self):
+        """Stop sampling the calling thread; returns {stack: count}"""
+        with self._lock:
+            return self._active.pop(threading.get_ident(), {})
+
+    def _sample_loop(self):
+        me = threading.get_ident()
+        while True:
+            with self._lock:
+                idle = not self._active
+            if idle:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, stacks in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is None or thread_id == me:
+                        continue
+                    stack = self._collapse(frame)
+                    stacks[stack] = stacks.get(stack, 0) + 1
+            del frames
+            time.sleep(self.interval)
+
+    @staticmethod
+    def _collapse(frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def save(self, stacks, summary):
+        """Write a profile and its summary, dropping the oldest beyond 'kept'"""
+        profile_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{uuid.uuid4().hex[:8]}"
+        summary = {'id': profile_id, 'samples': sum(stacks.values()), **summary}
+        base = os.path.join(self.profiles_dir, profile_id)
+        with open(base + '.folded', 'w', encoding='utf-8') as f:
+            for stack, count in sorted(stacks.items(), key=lambda item: -item[1]):
+                f.write(f'{stack} {count}\n')
+        with open(base + '.json', 'w', encoding='utf-8') as f:
+            json.dump(summary, f)
+
+        for old in self.list()[self.kept:]:
+            for suffix in ('.folded', '.json'):
+                try:
+                    os.remove(os.path.join(self.profiles_dir, old['id'] + suffix))
+                except OSError:
+                    pass
+        return profile_id
+
+    def list(self):
+        """Saved profile summaries, newest first"""
+        summaries = []
+        for name in sorted(os.listdir(self.profiles_dir), reverse=True):
+            if name.endswith('.json'):
+                try:
+                    with open(os.path.join(self.profiles_dir, name), encoding='utf-8') as f:
+                        summaries.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        return summaries
+
+    def path(self, profile_id):
+        if not re.fullmatch(r'[0-9-]+-[0-9a-f]{8}', profile_id):
+            return None
+        path = os.path.join(self.profiles_dir, profile_id + '.folded')
+        return path if os.path.exists(path) else None
+
+@app.before_request
+def start_request_timer():
+    request.environ['audify.started'] = time.perf_counter()
+    if PROFILE_SLOW_MS:
+        get_request_profiler().start()
+
+@app.after_request
+def record_request_time(response):
+    started = request.environ.get('audify.started')
+    if started is not None:
+        # The rule, not the path, keeps the label set bounded
+        elapsed = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe('audify_http_request_duration_seconds', elapsed,
+                        route=route, method=request.method, status=response.status_code)
+        if PROFILE_SLOW_MS:
+            save_slow_profile(elapsed, route, response.status_code)
+    return response
+
+def save_slow_profile(elapsed, route, status):
+    profiler = get_request_profiler()
+    stacks = profiler.stop()
+    if elapsed * 1000 < PROFILE_SLOW_MS or not stacks:
+        return
+    try:
+        profile_id = profiler.save(stacks, {
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'route': route,
+            'status': status,
+            'duration_ms': round(elapsed * 1000, 1),
+            'created_at': time.time()
+        })
+        logging.info(f"Slow request {request.method} {request.path} took {elapsed:.2f}s, profile {profile_id}")
+    except Exception as e:
+        print(f"Failed to save request profile: {e}")
+
+@app.teardown_request
+def stop_request_profile(exception=None):
+    # Requests that failed before after_request still leave the sampler
+    if PROFILE_SLOW_MS and _request_profiler is not None:
+        _request_profiler.stop()
+
+def admin_allowed():
+    """With AUDIFY_ADMIN_TOKEN set, requests must send it; without one, only
+    clients on this machine are let in"""
+    if ADMIN_TOKEN:
+        return hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN)
+    try:
+        return ipaddress.ip_address(request.remote_addr or '').is_loopback
+    except ValueError:
+        return False
+
+@app.route('/api/admin/profiles')
+def list_profiles():
+    """Summaries of saved slow request profiles, newest first"""
+    if not admin_allowed():
+        return jsonify({'error': 'Forbidden'}), 403
+    if not PROFILE_SLOW_MS:
+        return jsonify({'enabled': False, 'profiles': []})
+    return jsonify({
+        'enabled': True,
+        'threshold_ms': PROFILE_SLOW_MS,
+        'profiles': get_request_profiler().list()
+    })
+
+@app.route('/api/admin/profiles/<profile_id>')
+def get_profile(profile_id):
+    """A saved profile in collapsed stack format"""
+    if not admin_allowed():
+        return jsonify({'error': 'Forbidden'}), 403
+    path = get_request_profiler().path(profile_id) if PROFILE_SLOW_MS else None
+    if path is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    return send_file(path, mimetype='text/plain', as_attachment=request.args.get('download') == '1',
+                     download_name=f'{profile_id}.folded')
+
+@metrics.collector
+def collect_cache_metrics():
+    if _youtube_manager is None:
+        return
+    caches = {
+        'stream': _youtube_manager.stream_cache,
+        'search': _youtube_manager.search_cache,
+        'related': _youtube_manager.related_cache,
+    }
+    for name, cache in caches.items():
+        stats = cache.stats()
+        for result, key in (('hit', 'hits'), ('stale_hit', 'stale_hits'), ('miss', 'misses')):
+            yield 'audify_cache_lookups_total', {'cache': name, 'result': result}, stats[key]
+        yield 'audify_cache_entries', {'cache': name}, stats['size']
+
+@metrics.collector
+def collect_download_metrics():
+    if _download_manager is None:
+        return
+    yield 'audify_download_queue_depth', {}, _download_manager._queue.qsize()
+    statuses = {}
+    for job in _download_manager.list_jobs():
+        statuses[job.status] = statuses.get(job.status, 0) + 1
+    for status, count in statuses.items():
+        yield 'audify_download_jobs', {'status': status}, count
+
+@app.route('/api/metrics')
+def get_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/cache/stats')
+def cache_stats():
+    yt = get_youtube_manager()
+    return jsonify({
+        'stream': yt.stream_cache.stats(),
+        'search': yt.search_cache.stats(),
+        'related': yt.related_cache.stats()
+    })
+
 @app.route('/api/stream/<video_id>')
 def get_stream(video_id):
     try:
-        yt = YouTubeManager()
+        yt = get_youtube_manager()
         stream_info = yt.get_stream_url(video_id)
         if stream_info and stream_info.get('proxied_url'):
+            get_app_data().record_activity(video_id, 'plays')
+            get_recommendation_engine().mark_dirty()
             response = jsonify(stream_info)
             response.headers.update({
                 'Access-Control-Allow-Origin': '*',
@@ -427,110 +3124,834 @@ def get_stream(video_id):
         print(f"Stream error: {str(e)}")
         return jsonify({'error': str(e)}), 400
 
-@app.route('/api/download/<video_id>')
+@app.route('/api/stream/batch', methods=['POST'])
+def get_stream_batch():
+    """Resolve several tracks in one request: {"ids": [...]}. The response is
+    NDJSON, one {"id", "status", "stream"|"error"} line per id. Cached ids are
+    written first, the rest as they resolve, then a {"done": true} summary."""
+    data = _json_object()
+    if data is None:
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    video_ids = data.get('ids')
+    if not isinstance(video_ids, list) or not all(isinstance(v, str) and v for v in video_ids):
+        return jsonify({'error': 'Expected {"ids": [video ids]}'}), 400
+    video_ids = list(dict.fromkeys(video_ids))
+    if len(video_ids) > STREAM_BATCH_MAX_IDS:
+        return jsonify({'error': f'At most {STREAM_BATCH_MAX_IDS} ids per request'}), 400
+
+    yt = get_youtube_manager()
+
+    def line(payload):
+        return json.dumps(payload) + '\n'
+
+    def generate():
+        resolved = failed = 0
+        pending = []
+        for video_id in video_ids:
+            stream = yt.cached_stream_url(video_id)
+            if stream:
+                resolved += 1
+                yield line({'id': video_id, 'status': 'ok', 'cached': True, 'stream': stream})
+            else:
+                pending.append(video_id)
+
+        executor = get_stream_batch_executor()
+        futures = {executor.submit(yt.get_stream_url, video_id): video_id for video_id in pending}
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                video_id = futures[future]
+                try:
+                    stream = future.result()
+                except Exception as e:
+                    stream, error = None, str(e)
+                else:
+                    error = 'No valid stream URL found'
+                if stream:
+                    resolved += 1
+                    yield line({'id': video_id, 'status': 'ok', 'cached': False, 'stream': stream})
+                else:
+                    failed += 1
+                    yield line({'id': video_id, 'status': 'error', 'error': error})
+        finally:
+            # The client went away: drop work that has not started yet
+            for future in futures:
+                future.cancel()
+        yield line({'done': True, 'resolved': resolved, 'failed': failed})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/download/<video_id>', methods=['GET', 'POST'])
 def download_youtube_track(video_id):
-    yt = YouTubeManager()
+    downloads = get_download_manager()
+
+    # POST queues the download and answers immediately with the job
+    if request.method == 'POST':
+        data = _json_object()
+        if data is None:
+            return jsonify({'error': 'Expected a JSON object'}), 400
+        profile = data.get('profile')
+    else:
+        profile = request.args.get('profile')
+    if profile is not None and profile not in DOWNLOAD_PROFILES:
+        return jsonify({'error': f'Unknown profile, expected one of {sorted(DOWNLOAD_PROFILES)}'}), 400
+
+    if request.method == 'POST':
+        try:
+            priority = int(data.get('priority', 0))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'priority must be an integer'}), 400
+        job = downloads.submit(video_id, priority, profile)
+        return jsonify({'status': 'queued', 'job_id': job.id, 'job': job.to_dict()}), 202
+
+    # GET keeps the original blocking behaviour, jumping the queue
     try:
-        download_progress[video_id] = 0
-        filename = yt.download_track(video_id, lambda p: update_download_progress(video_id, p))
-        if filename:
-            download_progress[video_id] = 1
-            return jsonify({'status': 'success', 'filename': filename})
+        job = downloads.submit(video_id, priority=10, profile=profile)
+        # A job held by a paused batch would tie this request up until the
+        # batch is resumed
+        while not job.done.is_set():
+            if job.status == 'paused':
+                return jsonify({'status': 'paused', 'job_id': job.id, 'job': job.to_dict()}), 409
+            job.done.wait(1)
+        if job.status == 'done':
+            return jsonify({'status': 'success', 'filename': job.filename})
     except Exception as e:
         print(f"Download error: {str(e)}")
-    finally:
-        if video_id in download_progress:
-            del download_progress[video_id]
     return jsonify({'status': 'error', 'message': 'Failed to download track'}), 500
 
+@app.route('/api/playlists/<playlist_id>/download', methods=['POST'])
+def download_playlist(playlist_id):
+    """Queue every track of a playlist that is not downloaded yet as one batch.
+    Progress is published on the 'batch:<id>' topic of /api/events."""
+    app_data = get_app_data()
+    playlist = app_data.get_playlists().get(playlist_id)
+    if playlist is None:
+        return jsonify({'error': 'Playlist not found'}), 404
+
+    data = _json_object()
+    if data is None:
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    profile = data.get('profile')
+    if profile is not None and profile not in DOWNLOAD_PROFILES:
+        return jsonify({'error': f'Unknown profile, expected one of {sorted(DOWNLOAD_PROFILES)}'}), 400
+    try:
+        priority = int(data.get('priority', 0))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'priority must be an integer'}), 400
+
+    downloaded = {track['id'] for track in app_data.get_downloads()}
+    batch = get_download_manager().submit_batch(
+        [song['id'] for song in playlist['songs'] if song.get('id')],
+        priority=priority, profile=profile,
+        skip=downloaded, playlist_id=playlist_id
+    )
+    return jsonify({'status': 'queued', 'batch_id': batch.id, 'batch': batch.to_dict()}), 202
+
+@app.route('/api/batches/<batch_id>')
+def get_batch(batch_id):
+    batch = get_download_manager().get_batch(batch_id)
+    if batch is None:
+        return jsonify({'error': 'Batch not found'}), 404
+    return jsonify(batch.to_dict())
+
+@app.route('/api/batches/<batch_id>/<action>', methods=['POST'])
+def control_batch(batch_id, action):
+    batch = get_download_manager().get_batch(batch_id)
+    if batch is None:
+        return jsonify({'error': 'Batch not found'}), 404
+    if action not in ('pause', 'resume', 'cancel'):
+        return jsonify({'error': 'Unknown action'}), 400
+    changed = getattr(batch, action)()
+    return jsonify({'success': changed, 'batch': batch.to_dict()})
+
+@app.route('/api/jobs')
+def list_jobs():
+    return jsonify([job.to_dict() for job in get_download_manager().list_jobs()])
+
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    job = get_download_manager().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+def download_progress_state(video_id):
+    """Progress and status of a track's live or last download, from the job,
+    its last published event or the library; None if nothing is known"""
+    job = get_download_manager().latest(video_id)
+    if job:
+        return {'progress': job.progress, 'status': job.status}
+    state = event_bus.state(f'download:{video_id}')
+    if state:
+        return {'progress': state.get('progress', 0), 'status': state.get('status')}
+    if get_app_data().get_track(video_id):
+        return {'progress': 1, 'status': 'done'}
+    return None
+
 @app.route('/api/download/<video_id>/progress')
 def get_download_progress(video_id):
+    topic = f'download:{video_id}'
+
+    def generate():
+        seq = event_bus.seq
+        state = download_progress_state(video_id) or {'progress': 0, 'status': None}
+        yield sse_message(state)
+        if state['status'] in ('done', 'failed', 'cancelled'):
+            return
+        give_up = time.monotonic() + DOWNLOAD_PROGRESS_WAIT
+        while True:
+            events = event_bus.wait(seq)
+            for event_seq, event_topic, event, delta in events:
+                seq = event_seq
+                if event_topic != topic:
+                    continue
+                state.update({key: delta[key] for key in ('progress', 'status') if key in delta})
+                yield sse_message(state)
+                if event in ('done', 'failed', 'cancelled'):
+                    return
+            if state['status'] is None and time.monotonic() > give_up:
+                state['status'] = 'unknown'
+                yield sse_message(state)
+                return
+            if not events:
+                yield ': heartbeat\n\n'
+
+    return sse_response(generate())
+
+@app.route('/api/events')
+def stream_events():
+    """Multiplexed job events. Optional ?topic= filters (repeatable) match a
+    topic exactly or by kind, e.g. 'download' or 'download:<video_id>'."""
+    matches = topic_matcher(request.args.getlist('topic'))
+    last_id = request.headers.get('Last-Event-ID', request.args.get('last_event_id'))
+
     def generate():
+        if last_id and last_id.isdigit():
+            seq = int(last_id)
+        else:
+            seq = event_bus.seq
+            for topic, state in event_bus.snapshot():
+                if matches(topic):
+                    yield sse_message({'topic': topic, **state}, 'snapshot', seq)
+        while True:
+            events = event_bus.wait(seq)
+            if not events:
+                yield ': heartbeat\n\n'
+                continue
+            for event_seq, topic, event, delta in events:
+                seq = event_seq
+                if matches(topic):
+                    yield sse_message({'topic': topic, **delta}, event, event_seq)
+
+    return sse_response(generate())
+
+class TeeReaderBehind(Exception):
+    """Raised to a reader of an UpstreamTee whose next chunk was dropped"""
+
+class UpstreamTee:
+    """One upstream audio response read by every client that asked for the
+    same bytes within PROXY_TEE_JOIN_WINDOW of it opening. Readers pull
+    chunks from a shared buffer, and whichever runs ahead reads the next one
+    from upstream. Chunks every reader has consumed are dropped once the join
+    window closes. A reader more than PROXY_TEE_BUFFER_BYTES behind the
+    fastest loses its place and continues on its own ranged request."""
+    def __init__(self, video_id, client_headers, upstream, on_close=None):
+        self.video_id = video_id
+        self.if_range = client_headers.get('If-Range')
+        self.upstream = upstream
+        self.status_code = upstream.status_code
+        self.headers = upstream.headers
+        self.shareable = upstream.status_code in (200, 206)
+        self.body_start, self.body_end = self._body_span(upstream)
+        self._on_close = on_close
+        self._source = upstream.iter_content(chunk_size=PROXY_CHUNK_SIZE)
+        self._cond = threading.Condition()
+        self._chunks = deque()
+        self._base = 0
+        self._buffered = 0
+        self._readers = {}
+        self._next_reader = 0
+        self._join_until = time.monotonic() + PROXY_TEE_JOIN_WINDOW
+        self._joined = False
+        self._pulling = False
+        self._done = False
+        self._closed = False
+        self._error = None
+
+    @staticmethod
+    def _body_span(upstream):
+        """First and last (inclusive, None if unknown) byte offsets of the body"""
+        match = re.match(r'bytes (\d+)-(\d+)/', upstream.headers.get('Content-Range', ''))
+        if upstream.status_code == 206 and match:
+            return int(match.group(1)), int(match.group(2))
+        length = upstream.headers.get('Content-Length')
+        return 0, int(length) - 1 if length and length.isdigit() else None
+
+    def _joinable(self):
+        return not self._base and time.monotonic() < self._join_until
+
+    def join(self):
+        """A TeeResponse reading from the start of the body, or None once the
+        join window has closed or the response cannot be shared"""
+        with self._cond:
+            if self._closed or (self._joined and not (self.shareable and self._joinable())):
+                return None
+            self._joined = True
+            reader = self._next_reader
+            self._next_reader += 1
+            self._readers[reader] = 0
+        return TeeResponse(self, reader)
+
+    def _trim(self):
+        # Late joiners start from the first chunk, so keep everything while
+        # they may still come; after that only what a reader has yet to read
+        keep_from = self._base if self._joinable() else min(self._readers.values(), default=self._base)
+        while self._chunks and (self._base < keep_from or
+                                (self._buffered > PROXY_TEE_BUFFER_BYTES and len(self._chunks) > 1)):
+            self._buffered -= len(self._chunks.popleft())
+            self._base += 1
+
+    def read(self, reader):
+        """Next chunk for a reader, or None at the end of the body"""
         while True:
-            progress = download_progress.get(video_id, 0)
-            yield f"data: {{'progress': {progress}}}\n\n"
-            if progress >= 1:
+            with self._cond:
+                while True:
+                    index = self._readers.get(reader)
+                    if index is None or index < self._base:
+                        raise TeeReaderBehind()
+                    if index < self._base + len(self._chunks):
+                        self._readers[reader] = index + 1
+                        chunk = self._chunks[index - self._base]
+                        self._trim()
+                        return chunk
+                    if self._done:
+                        if self._error is not None:
+                            raise self._error
+                        return None
+                    if not self._pulling:
+                        self._pulling = True
+                        break
+                    self._cond.wait()
+
+            chunk, error = None, None
+            try:
+                chunk = next(self._source, None)
+            except Exception as e:
+                error = e
+
+            with self._cond:
+                self._pulling = False
+                if chunk is None:
+                    self._done = True
+                    self._error = error
+                elif chunk:
+                    metrics.inc('audify_upstream_bytes_total', len(chunk))
+                    self._chunks.append(chunk)
+                    self._buffered += len(chunk)
+                    self._trim()
+                self._cond.notify_all()
+
+    def reopen(self, offset):
+        """Own upstream response for the rest of the body from offset, for a
+        reader that fell behind the shared buffer"""
+        end = '' if self.body_end is None else self.body_end
+        headers = {'Range': f'bytes={offset}-{end}'}
+        if self.if_range:
+            headers['If-Range'] = self.if_range
+        upstream = request_upstream(self.video_id, headers)
+        if upstream is None:
+            raise IOError('Could not reopen the upstream response')
+        if upstream_body_range(upstream)[0] != offset:
+            upstream.close()
+            raise IOError('Upstream did not resume at the requested offset')
+        return upstream
+
+    def leave(self, reader):
+        with self._cond:
+            self._readers.pop(reader, None)
+            if self._readers or self._closed:
+                self._trim()
+                return
+            self._closed = True
+            self._chunks.clear()
+            self._buffered = 0
+        self.upstream.close()
+        if self._on_close:
+            self._on_close(self)
+
+class TeeResponse:
+    """A reader of an UpstreamTee with the parts of the requests.Response
+    interface the proxy uses"""
+    def __init__(self, tee, reader):
+        self.tee = tee
+        self.reader = reader
+        self.status_code = tee.status_code
+        self.headers = tee.headers
+        self._own = None
+        self._closed = False
+
+    def iter_content(self, chunk_size=None):
+        # Chunks keep the size the shared upstream is read with
+        position = self.tee.body_start
+        try:
+            while True:
+                chunk = self.tee.read(self.reader)
+                if chunk is None:
+                    return
+                position += len(chunk)
+                yield chunk
+        except TeeReaderBehind:
+            self.tee.leave(self.reader)
+
+        self._own = self.tee.reopen(position)
+        for chunk in self._own.iter_content(chunk_size=PROXY_CHUNK_SIZE):
+            metrics.inc('audify_upstream_bytes_total', len(chunk))
+            yield chunk
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self.tee.leave(self.reader)
+            if self._own is not None:
+                self._own.close()
+
+_upstream_tees = {}
+_upstream_tees_lock = threading.Lock()
+_upstream_flights = SingleFlight()
+
+def _forget_tee(key, tee):
+    with _upstream_tees_lock:
+        if _upstream_tees.get(key) is tee:
+            del _upstream_tees[key]
+
+def request_upstream(video_id, client_headers):
+    """Request the upstream audio for a video, forwarding Range/If-Range and
+    resolving again once if the cached URL was revoked. None if the stream
+    could not be resolved."""
+    yt = get_youtube_manager()
+
+    for attempt in range(2):
+        stream_info = yt.resolve_stream(video_id)
+        if not stream_info:
+            return None
+
+        headers = dict(stream_info['http_headers'])
+        for header in PROXY_REQUEST_HEADERS:
+            if client_headers.get(header):
+                headers[header] = client_headers[header]
+
+        with metrics.timer('audify_upstream_ttfb_seconds'):
+            upstream = http_session.get(stream_info['direct_url'], headers=headers,
+                                        stream=True, timeout=PROXY_TIMEOUT)
+
+        # A cached URL may have been revoked early; resolve it again once
+        if upstream.status_code in (403, 410) and attempt == 0:
+            upstream.close()
+            yt.stream_cache.invalidate(video_id)
+            continue
+        return upstream
+
+def _open_upstream_tee(video_id, client_headers, key):
+    upstream = request_upstream(video_id, client_headers)
+    if upstream is None:
+        return None
+    tee = UpstreamTee(video_id, client_headers, upstream, on_close=lambda tee: _forget_tee(key, tee))
+    if tee.shareable:
+        with _upstream_tees_lock:
+            _upstream_tees[key] = tee
+    return tee
+
+def open_upstream_stream(video_id, client_headers=None):
+    """Open the upstream audio response for a video, forwarding Range/If-Range.
+    Identical requests in flight share one upstream response through an
+    UpstreamTee. Returns None if the stream could not be resolved."""
+    client_headers = client_headers or {}
+    key = (video_id,) + tuple(client_headers.get(header) for header in PROXY_REQUEST_HEADERS)
+
+    with _upstream_tees_lock:
+        tee = _upstream_tees.get(key)
+    response = tee.join() if tee else None
+    if response is not None:
+        metrics.inc('audify_upstream_shared_total')
+        return response
+
+    tee = _upstream_flights.do(key, lambda: _open_upstream_tee(video_id, client_headers, key))
+    if tee is None:
+        return None
+    response = tee.join()
+    if response is None:
+        # Another caller took an unshareable response or the shared one moved on
+        tee = _open_upstream_tee(video_id, client_headers, key)
+        response = tee.join() if tee else None
+    return response
+
+def parse_byte_range(range_header):
+    """Parse a single 'bytes=start-[end]' range; None for forms we do not cache"""
+    match = re.fullmatch(r'\s*bytes=(\d+)-(\d*)\s*', range_header)
+    if not match:
+        return None
+    start = int(match.group(1))
+    end = int(match.group(2)) if match.group(2) else None
+    if end is not None and end < start:
+        return None
+    return start, end
+
+def upstream_body_range(upstream):
+    """Offset of the first body byte and the total size of an upstream response"""
+    match = re.match(r'bytes (\d+)-\d+/(\d+)', upstream.headers.get('Content-Range', ''))
+    if upstream.status_code == 206 and match:
+        return int(match.group(1)), int(match.group(2))
+    if upstream.status_code == 200 and upstream.headers.get('Content-Length'):
+        return 0, int(upstream.headers['Content-Length'])
+    return None, None
+
+class BlockWriter:
+    """Collects an upstream body that starts at body_start and stores each
+    complete block in the segment cache"""
+    def __init__(self, cache, video_id, body_start, size):
+        self.cache = cache
+        self.video_id = video_id
+        self.size = size
+        # Bytes before the first block boundary cannot form a whole block
+        self.skip = -body_start % cache.block_size
+        self.buffer = bytearray()
+        self.buffer_start = body_start + self.skip
+
+    def feed(self, chunk):
+        block_size = self.cache.block_size
+        if self.skip >= len(chunk):
+            self.skip -= len(chunk)
+            return
+        self.buffer += chunk[self.skip:]
+        self.skip = 0
+        while len(self.buffer) >= block_size:
+            self.cache.write_block(self.video_id, self.buffer_start // block_size,
+                                   bytes(self.buffer[:block_size]))
+            del self.buffer[:block_size]
+            self.buffer_start += block_size
+
+    def finish(self):
+        """Store the final short block once the body reached the end of the file"""
+        if self.buffer and self.buffer_start + len(self.buffer) == self.size:
+            self.cache.write_block(self.video_id, self.buffer_start // self.cache.block_size,
+                                   bytes(self.buffer))
+        self.buffer = bytearray()
+
+def count_proxied(source, path):
+    """Pass chunks through, counting the bytes sent to the client"""
+    for chunk in source:
+        metrics.inc('audify_proxy_bytes_total', len(chunk), path=path)
+        yield chunk
+
+def clip_chunk(chunk, chunk_start, start, end):
+    """Part of a chunk at chunk_start that falls inside start..end (inclusive)"""
+    relay_from = max(start, chunk_start)
+    relay_to = min(end + 1, chunk_start + len(chunk))
+    if relay_from >= relay_to:
+        return b''
+    return chunk[relay_from - chunk_start:relay_to - chunk_start]
+
+def relay_and_cache(video_id, upstream, body_start, size, start, end):
+    """Relay upstream bytes start..end to the client, writing every complete
+    block of the upstream body into the segment cache"""
+    writer = BlockWriter(get_segment_cache(), video_id, body_start, size)
+    offset = body_start
+    try:
+        for chunk in upstream.iter_content(chunk_size=PROXY_CHUNK_SIZE):
+            part = clip_chunk(chunk, offset, start, end)
+            if part:
+                yield part
+            offset += len(chunk)
+            writer.feed(chunk)
+            # Stop once the block holding the last wanted byte is stored, in
+            # case upstream ignored the requested range
+            if writer.buffer_start > end:
                 break
-            time.sleep(0.1)
-    
-    return Response(generate(), mimetype='text/event-stream')
+        writer.finish()
+    finally:
+        upstream.close()
+
+def iter_segmented_range(video_id, size, start, end, read_cached=True):
+    """Yield bytes start..end, reading cached blocks from disk and fetching
+    each run of missing blocks from upstream. With read_cached=False cached
+    blocks are skipped, which only fills the cache."""
+    cache = get_segment_cache()
+    block_size = cache.block_size
+    last_block = end // block_size
+    position = start
+    while position <= end:
+        index = position // block_size
+        if cache.has_block(video_id, index):
+            run_end = min((index + 1) * block_size - 1, end)
+            if read_cached:
+                metrics.inc('audify_segment_blocks_total', result='hit')
+                yield from cache.read(video_id, position, run_end)
+            position = run_end + 1
+            continue
+
+        missing_until = cache.next_cached_block(video_id, index, last_block + 1)
+        if read_cached:
+            metrics.inc('audify_segment_blocks_total', missing_until - index, result='miss')
+        fetch_start = index * block_size
+        fetch_end = min(missing_until * block_size, size) - 1
+        upstream = open_upstream_stream(video_id, {'Range': f'bytes={fetch_start}-{fetch_end}'})
+        if upstream is None:
+            return
+        body_start, total = upstream_body_range(upstream)
+        if body_start is None or total != size:
+            upstream.close()
+            return
+        run_end = min(fetch_end, end)
+        yield from relay_and_cache(video_id, upstream, body_start, size, position, run_end)
+        position = run_end + 1
+
+def serve_cached_proxy(video_id, byte_range, ranged):
+    """Serve /api/proxy through the segment cache; None means fall back to
+    relaying upstream directly"""
+    cache = get_segment_cache()
+    start, end = byte_range
+    entry = cache.lookup(video_id)
+
+    if entry is None:
+        fetch_start = start - start % cache.block_size
+        fetch_end = '' if end is None else (end // cache.block_size + 1) * cache.block_size - 1
+        upstream = open_upstream_stream(video_id, {'Range': f'bytes={fetch_start}-{fetch_end}'})
+        if upstream is None:
+            return jsonify({'error': 'Failed to get stream URL'}), 400
+        body_start, size = upstream_body_range(upstream)
+        if body_start is None or start >= size:
+            upstream.close()
+            return None
+        content_type = upstream.headers.get('Content-Type', 'audio/mp4')
+        cache.register(video_id, size, content_type)
+        end = size - 1 if end is None else min(end, size - 1)
+        source = count_proxied(relay_and_cache(video_id, upstream, body_start, size, start, end), 'relay')
+    else:
+        upstream = None
+        size = entry['size']
+        content_type = entry['content_type']
+        if start >= size:
+            return Response(status=416, headers={'Content-Range': f'bytes */{size}'})
+        if entry['complete']:
+            response = send_file(cache.path(video_id), mimetype=content_type, conditional=True)
+            metrics.inc('audify_proxy_bytes_total', response.content_length or 0, path='cache')
+            return response
+        end = size - 1 if end is None else min(end, size - 1)
+        source = count_proxied(iter_segmented_range(video_id, size, start, end), 'segmented')
+
+    headers = {
+        'Content-Type': content_type,
+        'Content-Length': str(end - start + 1),
+        'Accept-Ranges': 'bytes',
+    }
+    if ranged:
+        headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response = Response(
+        stream_with_context(source),
+        status=206 if ranged else 200,
+        headers=headers,
+        direct_passthrough=upstream is None
+    )
+    if upstream is not None:
+        # relay_and_cache only closes upstream once it has started; close
+        # callbacks need the response's own app iterator, so no passthrough
+        response.call_on_close(upstream.close)
+    return response
+
+def prefetch_range(video_id, length):
+    """Fill the segment cache with the first length bytes of a track"""
+    cache = get_segment_cache()
+    entry = cache.lookup(video_id)
+    if entry is None:
+        fetch_end = ((length - 1) // cache.block_size + 1) * cache.block_size - 1
+        upstream = open_upstream_stream(video_id, {'Range': f'bytes=0-{fetch_end}'})
+        if upstream is None:
+            return
+        body_start, size = upstream_body_range(upstream)
+        if body_start is None:
+            upstream.close()
+            return
+        cache.register(video_id, size, upstream.headers.get('Content-Type', 'audio/mp4'))
+        source = relay_and_cache(video_id, upstream, body_start, size, 0, min(fetch_end, size - 1))
+    else:
+        end = min(length, entry['size']) - 1
+        source = iter_segmented_range(video_id, entry['size'], 0, end, read_cached=False)
+    for _ in source:
+        pass
+
+class Prefetcher:
+    """Resolves upcoming tracks and warms their opening seconds into the
+    segment cache in the background, within a total byte budget"""
+    def __init__(self, workers=PREFETCH_WORKERS, budget_bytes=PREFETCH_BUDGET_BYTES):
+        self.budget_bytes = budget_bytes
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='audify-prefetch')
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._reserved = 0
+
+    def prefetch(self, video_ids, seconds=PREFETCH_SECONDS):
+        """Queue warm-ups; returns the ids that were not already pending"""
+        cache = get_segment_cache()
+        queued = []
+        with self._lock:
+            for video_id in video_ids:
+                if not isinstance(video_id, str) or not cache.is_cacheable(video_id):
+                    continue
+                if video_id in self._pending:
+                    continue
+                self._pending.add(video_id)
+                queued.append(video_id)
+        for video_id in queued:
+            self.executor.submit(self._warm, video_id, seconds)
+        return queued
 
-def update_download_progress(video_id, progress):
-    download_progress[video_id] = progress
+    def _reserve(self, length):
+        with self._lock:
+            if self._reserved + length > self.budget_bytes:
+                return False
+            self._reserved += length
+            return True
+
+    def _release(self, length):
+        with self._lock:
+            self._reserved -= length
+
+    def _warm(self, video_id, seconds):
+        try:
+            stream = get_youtube_manager().resolve_stream(video_id)
+            if not stream or seconds <= 0:
+                return
+            bitrate = stream.get('abr') or DEFAULT_AUDIO_BITRATE
+            length = min(int(bitrate * 125 * seconds), PREFETCH_TRACK_MAX_BYTES)
+            # Over budget: the URL is resolved, skip buffering audio this time
+            if not self._reserve(length):
+                return
+            try:
+                prefetch_range(video_id, length)
+            finally:
+                self._release(length)
+        except Exception as e:
+            print(f"Prefetch error ({video_id}): {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(video_id)
 
 # Add new proxy route for audio streaming
 @app.route('/api/proxy/<video_id>')
 def proxy_stream(video_id):
     try:
-        yt = YouTubeManager()
-        stream_info = yt.get_stream_url(video_id)
-        
-        if not stream_info:
+        # Serve through the segment cache unless the request needs validators
+        # or a range form the cache does not handle
+        range_header = request.headers.get('Range')
+        byte_range = parse_byte_range(range_header) if range_header else (0, None)
+        if (byte_range and not request.headers.get('If-Range')
+                and get_segment_cache().is_cacheable(video_id)):
+            response = serve_cached_proxy(video_id, byte_range, bool(range_header))
+            if response is not None:
+                return response
+
+        upstream = open_upstream_stream(video_id, request.headers)
+        if upstream is None:
             return jsonify({'error': 'Failed to get stream URL'}), 400
 
-        # Get the direct URL from YouTube
-        url = stream_info['direct_url']
-        
-        # Make a streaming request to YouTube
-        req = requests.get(url, stream=True)
-        
+        if upstream.status_code not in (200, 206, 416):
+            upstream.close()
+            return jsonify({'error': f'Upstream returned {upstream.status_code}'}), 502
+
+        headers = {
+            header: upstream.headers[header]
+            for header in PROXY_RESPONSE_HEADERS
+            if header in upstream.headers
+        }
+        headers.setdefault('Content-Type', 'audio/mp4')
+        headers.setdefault('Accept-Ranges', 'bytes')
+
+        def generate():
+            for chunk in upstream.iter_content(chunk_size=PROXY_CHUNK_SIZE):
+                metrics.inc('audify_proxy_bytes_total', len(chunk), path='direct')
+                yield chunk
+
         # Stream the response back to client
-        return Response(
-            stream_with_context(req.iter_content(chunk_size=2048)),
-            content_type=req.headers.get('content-type', 'audio/mp4'),
-            headers={
-                'Accept-Ranges': 'bytes',
-                'Content-Length': req.headers.get('content-length'),
-            }
+        # Not direct_passthrough: that hands the server the bare generator
+        # and skips the response's close callbacks
+        response = Response(
+            stream_with_context(generate()),
+            status=upstream.status_code,
+            headers=headers
         )
+        # Runs even when the body is never iterated (HEAD, a failed send),
+        # so the upstream connection or tee reader is always released
+        response.call_on_close(upstream.close)
+        return response
 
     except Exception as e:
         print(f"Proxy error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/prefetch', methods=['POST'])
+def prefetch_tracks():
+    """Resolve and buffer upcoming tracks: {"ids": [...], "seconds": 20}"""
+    data = _json_object()
+    if data is None:
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    video_ids = data.get('ids') or []
+    if not isinstance(video_ids, list):
+        return jsonify({'error': 'ids must be a list'}), 400
+    try:
+        seconds = max(0, min(float(data.get('seconds', PREFETCH_SECONDS)), PREFETCH_MAX_SECONDS))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'seconds must be a number'}), 400
+    queued = get_prefetcher().prefetch(video_ids[:PREFETCH_MAX_IDS], seconds)
+    return jsonify({'queued': queued}), 202
+
 @app.route('/api/local/<path:filename>')
 def serve_local_audio(filename):
     try:
-        app_data = AppDataManager()
-        file_path = os.path.join(app_data.downloads_dir, filename)
-        return send_file(file_path, mimetype='audio/mpeg')
+        return serve_indexed_file(get_app_data().downloads_index, filename)
     except Exception as e:
         print(f"Error serving local file: {e}")
         return jsonify({'error': 'File not found'}), 404
 
 @app.route('/api/downloads')
 def get_downloads():
-    app_data = AppDataManager()
-    downloads = app_data.get_downloads()
-    return jsonify(downloads)
+    app_data = get_app_data()
+    index = app_data.downloads_index
+    index.files()
+    return cached_json_listing('downloads', (index.version, app_data.tracks_version), app_data.get_downloads)
 
 # Add new route for startup recommendations
 @app.route('/api/recommendations')
 def get_recommendations():
-    app_data = AppDataManager()
-    recommendations = app_data.get_recommendations()
+    limit = max(1, min(request.args.get('limit', 10, type=int), RECOMMENDATION_LIMIT))
+    offset = max(0, request.args.get('offset', 0, type=int))
+    recommendations = get_recommendation_engine().recommendations(limit, offset)
     return jsonify(recommendations)
 
 # Add new API routes
 @app.route('/api/playlists', methods=['GET', 'POST'])
 def handle_playlists():
-    app_data = AppDataManager()
+    app_data = get_app_data()
     
     if request.method == 'POST':
         data = request.json
         playlist_id = app_data.create_playlist(data['name'])
         return jsonify({'success': True, 'id': playlist_id})
     
-    playlists = app_data._load_playlists()
+    playlists = app_data.get_playlists()
     return jsonify(playlists)
 
 @app.route('/api/playlists/<playlist_id>/songs', methods=['POST', 'DELETE'])
 def handle_playlist_songs(playlist_id):
-    app_data = AppDataManager()
+    app_data = get_app_data()
     
     if request.method == 'POST':
         song_data = request.json
         success = app_data.add_song_to_playlist(playlist_id, song_data)
+        if success:
+            get_recommendation_engine().mark_dirty()
         return jsonify({'success': success})
     
     song_id = request.args.get('song_id')
@@ -543,12 +3964,9 @@ def handle_playlist_songs(playlist_id):
 # Add route to handle deleting a playlist
 @app.route('/api/playlists/<playlist_id>', methods=['DELETE'])
 def delete_playlist(playlist_id):
-    app_data = AppDataManager()
-    playlists = app_data._load_playlists()
+    app_data = get_app_data()
     
-    if playlist_id in playlists:
-        del playlists[playlist_id]
-        app_data._save_playlists(playlists)
+    if app_data.delete_playlist(playlist_id):
         return jsonify({'success': True})
     
     return jsonify({'success': False, 'error': 'Playlist not found'})
@@ -557,12 +3975,25 @@ class SpotifyImporter:
     def __init__(self, app_data_manager):
         self.app_data = app_data_manager
         self.temp_dir = tempfile.mkdtemp(prefix='spotify_import_')
+        self.id = str(uuid.uuid4())
+        self.status = 'queued'
+        self.error = None
         self.progress = 0
         self.total_songs = 0
         app.config['spotify_importer'] = self
         self.save_file = os.path.join(self.temp_dir, 'playlist.spotdl')
         self.metadata_file = os.path.join(self.temp_dir, 'song_metadata.txt')
 
+    def _publish(self, event='update'):
+        event_bus.publish(f'import:{self.id}', {
+            'id': self.id,
+            'kind': 'import',
+            'status': self.status,
+            'progress': self.progress,
+            'total_songs': self.total_songs,
+            'error': self.error
+        }, event)
+
     def validate_spotify_url(self, url):
         """Validate if the URL is a valid Spotify playlist URL"""
         try:
@@ -603,8 +4034,7 @@ class SpotifyImporter:
                 return None, []
 
             # Create YouTube manager for consistent metadata format
-            yt = YouTubeManager()
-            processed_songs = []
+            yt = get_youtube_manager()
             playlist_name = None
 
             # Read and process save file
@@ -621,32 +4051,25 @@ class SpotifyImporter:
                     return None, []
             
             self.total_songs = len(songs)
-            
-            # Process each song using YouTube search
-            for i, song in enumerate(songs):
-                try:
-                    # Search YouTube using song info
-                    search_query = f"{song['name']} {song['artist']}"
-                    search_results = yt.search(search_query)
-                    
-                    if search_results and len(search_results) > 0:
-                        # Use first result
-                        track = search_results[0]
-                        processed_songs.append({
-                            'id': track['id'],
-                            'title': track['title'],
-                            'uploader': track['uploader'],
-                            'thumbnails': track['thumbnails'],
-                            'duration': track['duration']
-                        })
-                        
-                        # Update progress
-                        self.progress = ((i + 1) / self.total_songs) * 100
-                        logging.info(f"Processed {i+1}/{self.total_songs}: {track['title']}")
-                        
-                except Exception as e:
-                    logging.error(f"Error processing song {song.get('name')}: {e}")
-                    continue
+            self.status = 'resolving'
+            self._publish()
+
+            # Resolve songs concurrently; map() keeps the playlist order
+            completed = itertools.count(1)
+            progress_lock = threading.Lock()
+
+            def resolve(song):
+                track = self._resolve_song(yt, song)
+                with progress_lock:
+                    done = next(completed)
+                    self.progress = (done / self.total_songs) * 100
+                    self._publish()
+                if track:
+                    logging.info(f"Processed {done}/{self.total_songs}: {track['title']}")
+                return track
+
+            with ThreadPoolExecutor(max_workers=IMPORT_WORKERS) as executor:
+                processed_songs = [track for track in executor.map(resolve, songs) if track]
 
             return playlist_name, processed_songs
 
@@ -656,8 +4079,42 @@ class SpotifyImporter:
         finally:
             self.cleanup()
 
+    def _resolve_song(self, yt, song):
+        """Find the YouTube track for a Spotify song, reusing earlier matches"""
+        try:
+            track = self.app_data.get_import_match(song['name'], song['artist'])
+            if track:
+                return track
+
+            # Search YouTube using song info
+            search_results = yt.search(f"{song['name']} {song['artist']}")
+            if not search_results:
+                return None
+
+            # Use first result
+            result = search_results[0]
+            track = {
+                'id': result['id'],
+                'title': result['title'],
+                'uploader': result['uploader'],
+                'thumbnails': result['thumbnails'],
+                'duration': result['duration']
+            }
+            self.app_data.save_import_match(song['name'], song['artist'], track)
+            return track
+        except Exception as e:
+            logging.error(f"Error processing song {song.get('name')}: {e}")
+            return None
+
     def import_playlist(self, spotify_url, custom_name=None):
         """Import songs from Spotify playlist"""
+        result = self._import_playlist(spotify_url, custom_name)
+        self.status = 'done' if result['success'] else 'failed'
+        self.error = result.get('error')
+        self._publish(self.status)
+        return result
+
+    def _import_playlist(self, spotify_url, custom_name=None):
         logging.info(f"Starting playlist import: {spotify_url}")
         self.progress = 0
         
@@ -675,11 +4132,8 @@ class SpotifyImporter:
             final_name = custom_name or playlist_name or "Imported Playlist"
             playlist_id = self.app_data.create_playlist(final_name)
             
-            # Add songs to playlist
-            successful_imports = 0
-            for song in processed_songs:
-                if self.app_data.add_song_to_playlist(playlist_id, song):
-                    successful_imports += 1
+            # Add songs to playlist in a single write
+            successful_imports = self.app_data.add_songs_to_playlist(playlist_id, processed_songs)
 
             return {
                 'success': True,
@@ -707,7 +4161,7 @@ def import_spotify_playlist():
             return jsonify({'success': False, 'error': 'No URL provided'}), 400
 
         logging.info(f"Received import request for: {spotify_url}")
-        app_data = AppDataManager()
+        app_data = get_app_data()
         importer = SpotifyImporter(app_data)
         result = importer.import_playlist(spotify_url, custom_name)
         
@@ -730,8 +4184,352 @@ def get_import_progress():
         })
     return jsonify({'progress': 0, 'total_songs': 0})
 
+class AsyncServer:
+    """ASGI application for the asgi serving mode. The audio proxy and the
+    progress streams run on the event loop with a non-blocking upstream
+    client; stream resolution and every other Flask route run on bounded
+    thread pools."""
+    PROXY_PATH = re.compile(r'/api/proxy/([^/]+)')
+    PROGRESS_PATH = re.compile(r'/api/download/([^/]+)/progress')
+
+    def __init__(self, flask_app, workers=ASYNC_BLOCKING_WORKERS):
+        try:
+            import httpx
+            from a2wsgi import WSGIMiddleware
+        except ImportError as e:
+            raise RuntimeError("The asgi serving mode needs httpx and a2wsgi; see requirements-asgi.txt") from e
+        self.httpx = httpx
+        self.wsgi = WSGIMiddleware(flask_app, workers=workers)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='audify-blocking')
+        self.client = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] == 'http' and scope['method'] == 'GET':
+            path = scope['path']
+            match = self.PROXY_PATH.fullmatch(path)
+            if match:
+                return await self._until_disconnect(self.proxy(scope, send, match.group(1)), receive)
+            match = self.PROGRESS_PATH.fullmatch(path)
+            if match:
+                return await self._until_disconnect(self.download_progress(send, match.group(1)), receive)
+            if path == '/api/events':
+                return await self._until_disconnect(self.events(scope, send), receive)
+        return await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self._client()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.client is not None:
+                    await self.client.aclose()
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _client(self):
+        if self.client is None:
+            self.client = self.httpx.AsyncClient(
+                timeout=self.httpx.Timeout(PROXY_TIMEOUT[1], connect=PROXY_TIMEOUT[0]),
+                limits=self.httpx.Limits(max_keepalive_connections=PROXY_POOL_SIZE),
+                follow_redirects=True
+            )
+        return self.client
+
+    async def _until_disconnect(self, handler, receive):
+        """Run a streaming handler, cancelling it when the client goes away"""
+        async def wait_for_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+
+        task = asyncio.ensure_future(handler)
+        watcher = asyncio.ensure_future(wait_for_disconnect())
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    async def blocking(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args))
+
+    def _request_headers(self, scope):
+        return {
+            name.decode('latin-1').lower(): value.decode('latin-1')
+            for name, value in scope['headers']
+        }
+
+    async def _start(self, send, status, headers):
+        headers = {'Access-Control-Allow-Origin': '*', **headers}
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(name.lower().encode('latin-1'), str(value).encode('latin-1'))
+                        for name, value in headers.items()]
+        })
+
+    async def _body(self, send, data=b'', more=False):
+        await send({'type': 'http.response.body', 'body': data, 'more_body': more})
+
+    async def _json(self, send, status, payload):
+        await self._start(send, status, {'Content-Type': 'application/json'})
+        await self._body(send, json.dumps(payload).encode())
+
+    async def _open_upstream(self, video_id, client_headers):
+        """Async counterpart of open_upstream_stream"""
+        yt = await self.blocking(get_youtube_manager)
+        for attempt in range(2):
+            stream_info = await self.blocking(yt.resolve_stream, video_id)
+            if not stream_info:
+                return None
+            headers = {**stream_info['http_headers'], **client_headers}
+            request = self._client().build_request('GET', stream_info['direct_url'], headers=headers)
+            with metrics.timer('audify_upstream_ttfb_seconds'):
+                upstream = await self._client().send(request, stream=True)
+
+            # A cached URL may have been revoked early; resolve it again once
+            if upstream.status_code in (403, 410) and attempt == 0:
+                await upstream.aclose()
+                yt.stream_cache.invalidate(video_id)
+                continue
+            return upstream
+
+    async def proxy(self, scope, send, video_id):
+        try:
+            headers = self._request_headers(scope)
+            range_header = headers.get('range')
+            byte_range = parse_byte_range(range_header) if range_header else (0, None)
+            cache = await self.blocking(get_segment_cache)
+            if byte_range and not headers.get('if-range') and cache.is_cacheable(video_id):
+                if await self._proxy_cached(send, cache, video_id, byte_range, bool(range_header)):
+                    return
+
+            client_headers = {
+                header: headers[header.lower()]
+                for header in PROXY_REQUEST_HEADERS if headers.get(header.lower())
+            }
+            upstream = await self._open_upstream(video_id, client_headers)
+            if upstream is None:
+                return await self._json(send, 400, {'error': 'Failed to get stream URL'})
+            try:
+                if upstream.status_code not in (200, 206, 416):
+                    return await self._json(send, 502, {'error': f'Upstream returned {upstream.status_code}'})
+                response_headers = {
+                    header: upstream.headers[header]
+                    for header in PROXY_RESPONSE_HEADERS if header in upstream.headers
+                }
+                response_headers.setdefault('Content-Type', 'audio/mp4')
+                response_headers.setdefault('Accept-Ranges', 'bytes')
+                await self._start(send, upstream.status_code, response_headers)
+                async for chunk in upstream.aiter_raw(PROXY_CHUNK_SIZE):
+                    metrics.inc('audify_upstream_bytes_total', len(chunk))
+                    metrics.inc('audify_proxy_bytes_total', len(chunk), path='direct')
+                    await self._body(send, chunk, more=True)
+                await self._body(send)
+            finally:
+                await upstream.aclose()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Proxy error: {str(e)}")
+
+    async def _proxy_cached(self, send, cache, video_id, byte_range, ranged):
+        """Async counterpart of serve_cached_proxy; False means relay directly"""
+        start, end = byte_range
+        entry = cache.lookup(video_id)
+
+        if entry is None:
+            fetch_start = start - start % cache.block_size
+            fetch_end = '' if end is None else (end // cache.block_size + 1) * cache.block_size - 1
+            upstream = await self._open_upstream(video_id, {'Range': f'bytes={fetch_start}-{fetch_end}'})
+            if upstream is None:
+                await self._json(send, 400, {'error': 'Failed to get stream URL'})
+                return True
+            body_start, size = upstream_body_range(upstream)
+            if body_start is None or start >= size:
+                await upstream.aclose()
+                return False
+            content_type = upstream.headers.get('Content-Type', 'audio/mp4')
+            await self.blocking(cache.register, video_id, size, content_type)
+            end = size - 1 if end is None else min(end, size - 1)
+            await self._start_range(send, ranged, start, end, size, content_type)
+            await self._relay_and_cache(send, video_id, upstream, body_start, size, start, end)
+        else:
+            size = entry['size']
+            if start >= size:
+                await self._start(send, 416, {'Content-Range': f'bytes */{size}'})
+                await self._body(send)
+                return True
+            end = size - 1 if end is None else min(end, size - 1)
+            await self._start_range(send, ranged, start, end, size, entry['content_type'])
+            await self._send_segments(send, cache, video_id, size, start, end)
+
+        await self._body(send)
+        return True
+
+    async def _start_range(self, send, ranged, start, end, size, content_type):
+        headers = {
+            'Content-Type': content_type,
+            'Content-Length': str(end - start + 1),
+            'Accept-Ranges': 'bytes',
+        }
+        if ranged:
+            headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+        await self._start(send, 206 if ranged else 200, headers)
+
+    async def _relay_and_cache(self, send, video_id, upstream, body_start, size, start, end):
+        writer = BlockWriter(get_segment_cache(), video_id, body_start, size)
+        offset = body_start
+        try:
+            async for chunk in upstream.aiter_raw(PROXY_CHUNK_SIZE):
+                part = clip_chunk(chunk, offset, start, end)
+                if part:
+                    await self._body(send, part, more=True)
+                offset += len(chunk)
+                await self.blocking(writer.feed, chunk)
+                if writer.buffer_start > end:
+                    break
+            await self.blocking(writer.finish)
+        finally:
+            await upstream.aclose()
+
+    async def _send_segments(self, send, cache, video_id, size, start, end):
+        """Async counterpart of iter_segmented_range"""
+        block_size = cache.block_size
+        last_block = end // block_size
+        position = start
+        while position <= end:
+            index = position // block_size
+            if cache.has_block(video_id, index):
+                run_end = min((index + 1) * block_size - 1, end)
+                data = await self.blocking(lambda: b''.join(cache.read(video_id, position, run_end)))
+                await self._body(send, data, more=True)
+                position = run_end + 1
+                continue
+
+            missing_until = cache.next_cached_block(video_id, index, last_block + 1)
+            fetch_start = index * block_size
+            fetch_end = min(missing_until * block_size, size) - 1
+            upstream = await self._open_upstream(video_id, {'Range': f'bytes={fetch_start}-{fetch_end}'})
+            if upstream is None:
+                return
+            body_start, total = upstream_body_range(upstream)
+            if body_start is None or total != size:
+                await upstream.aclose()
+                return
+            run_end = min(fetch_end, end)
+            await self._relay_and_cache(send, video_id, upstream, body_start, size, position, run_end)
+            position = run_end + 1
+
+    async def _start_sse(self, send):
+        await self._start(send, 200, {
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+
+    async def download_progress(self, send, video_id):
+        """Async counterpart of get_download_progress"""
+        topic = f'download:{video_id}'
+        await self._start_sse(send)
+        seq = event_bus.seq
+        state = await self.blocking(download_progress_state, video_id) or {'progress': 0, 'status': None}
+        await self._body(send, sse_message(state).encode(), more=True)
+        if state['status'] in ('done', 'failed', 'cancelled'):
+            return await self._body(send)
+        give_up = time.monotonic() + DOWNLOAD_PROGRESS_WAIT
+        while True:
+            events = await event_bus.wait_async(seq)
+            for event_seq, event_topic, event, delta in events:
+                seq = event_seq
+                if event_topic != topic:
+                    continue
+                state.update({key: delta[key] for key in ('progress', 'status') if key in delta})
+                await self._body(send, sse_message(state).encode(), more=True)
+                if event in ('done', 'failed', 'cancelled'):
+                    return await self._body(send)
+            if state['status'] is None and time.monotonic() > give_up:
+                state['status'] = 'unknown'
+                await self._body(send, sse_message(state).encode(), more=True)
+                return await self._body(send)
+            if not events:
+                await self._body(send, b': heartbeat\n\n', more=True)
+
+    async def events(self, scope, send):
+        """Async counterpart of stream_events"""
+        params = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        matches = topic_matcher(params.get('topic', []))
+        last_id = self._request_headers(scope).get('last-event-id') or (params.get('last_event_id') or [None])[0]
+        await self._start_sse(send)
+        if last_id and last_id.isdigit():
+            seq = int(last_id)
+        else:
+            seq = event_bus.seq
+            for topic, state in event_bus.snapshot():
+                if matches(topic):
+                    await self._body(send, sse_message({'topic': topic, **state}, 'snapshot', seq).encode(), more=True)
+        while True:
+            events = await event_bus.wait_async(seq)
+            if not events:
+                await self._body(send, b': heartbeat\n\n', more=True)
+                continue
+            for event_seq, topic, event, delta in events:
+                seq = event_seq
+                if matches(topic):
+                    await self._body(send, sse_message({'topic': topic, **delta}, event, event_seq).encode(), more=True)
+
+def missing_asgi_dependency():
+    """Name of the first package the asgi serving mode needs that is not
+    installed, or None"""
+    for module in ASGI_DEPENDENCIES:
+        if importlib.util.find_spec(module) is None:
+            return module
+    return None
+
+def run_asgi_server(host=SERVER_HOST, port=SERVER_PORT):
+    missing = missing_asgi_dependency()
+    if missing:
+        print(f"The asgi serving mode needs uvicorn, httpx and a2wsgi, but {missing} is not installed.\n"
+              "Install them with 'pip install -r requirements-asgi.txt' or unset AUDIFY_SERVER_MODE.")
+        raise SystemExit(1)
+    import uvicorn
+    threading.Thread(target=warm_up, daemon=True).start()
+    uvicorn.run(AsyncServer(app), host=host, port=port, log_level='warning')
+
+def run_server():
+    """Serve the app in the configured mode, warming yt-dlp in the background"""
+    if SERVER_MODE == 'asgi':
+        run_asgi_server()
+        return
+    threading.Thread(target=warm_up, daemon=True).start()
+    app.run(host=SERVER_HOST, port=SERVER_PORT, debug=False, threaded=True)
+
+def wait_until_ready(timeout=SERVER_READY_TIMEOUT, interval=0.05):
+    """Poll /api/health until the server answers; False on timeout"""
+    host = '127.0.0.1' if SERVER_HOST in ('0.0.0.0', '') else SERVER_HOST
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(f'http://{host}:{SERVER_PORT}/api/health', timeout=1).ok:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(interval)
+    return False
+
 class Launcher:
     def __init__(self):
+        # pygame is only needed for this window; the headless server never imports it
+        global pygame
+        import pygame
         pygame.init()
         # Increased window size
         self.width = 800
@@ -813,10 +4611,17 @@ class Launcher:
         return button_rect
 
     def run_server(self):
-        app.run(debug=False, threaded=True)
+        run_server()
 
     def open_browser(self):
-        webbrowser.open('http://127.0.0.1:5000')
+        webbrowser.open(f'http://{SERVER_HOST}:{SERVER_PORT}')
+
+    def open_when_ready(self):
+        # Runs off the event loop so the window keeps redrawing meanwhile
+        if not wait_until_ready():
+            print("Server did not report ready in time, opening the browser anyway")
+        self.open_browser()
+        self.status_text = "Server Running - Click X to Close"
 
     def run(self):
         running = True
@@ -840,15 +4645,10 @@ class Launcher:
                         server_thread.daemon = True
                         server_thread.start()
                         
-                        # Wait a moment for server to start
-                        pygame.time.wait(1500)
-                        
-                        # Open browser
-                        self.open_browser()
+                        # Open the browser once the server answers
+                        threading.Thread(target=self.open_when_ready, daemon=True).start()
                         
                         self.server_running = True
-                        self.status_text = "Server Running - Click X to Close"
-                        self.status_color = self.button_color
             
             # Draw everything
             self.window.fill(self.bg_color)
@@ -860,5 +4660,10 @@ class Launcher:
         pygame.quit()
 
 if __name__ == "__main__":
-    launcher = Launcher()
-    launcher.run()
+    # --headless (or AUDIFY_HEADLESS=1) serves without the launcher window,
+    # e.g. in a container
+    if '--headless' in sys.argv[1:] or os.environ.get('AUDIFY_HEADLESS') == '1':
+        run_server()
+    else:
+        launcher = Launcher()
+        launcher.run()
@@ -404,6 +404,7 @@ class MusicPlayer {
                 uploader: track.uploader
             });
             this.playPauseBtn.innerHTML = '<i class="fas fa-pause"></i>';
+            this.prefetchUpcoming();
             
             // Load related content if needed
             if (this.isInitialSearch && this.autoplayToggle.checked) {
@@ -416,6 +417,36 @@ class MusicPlayer {
         }
     }
 
+    resolveQueue(fromIndex = 0) {
+        // Resolve the rest of the queue in one request so later tracks
+        // start from the server's stream cache
+        const ids = this.queue.slice(fromIndex).map(track => track.id).filter(Boolean).slice(0, 100);
+        if (ids.length === 0) return;
+
+        fetch('/api/stream/batch', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ ids })
+        })
+            .then(response => response.text())
+            .catch(error => console.error('Queue resolution failed:', error));
+    }
+
+    prefetchUpcoming() {
+        // Let the server resolve and buffer the next tracks in the background
+        const ids = this.queue
+            .slice(this.currentTrackIndex + 1, this.currentTrackIndex + 3)
+            .map(track => track.id)
+            .filter(Boolean);
+        if (ids.length === 0) return;
+
+        fetch('/api/prefetch', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ ids })
+        }).catch(error => console.error('Prefetch failed:', error));
+    }
+
     handlePlaybackError(error) {
         this.playPauseBtn.innerHTML = '<i class="fas fa-play"></i>';
         this.updatePlayerDisplay({
@@ -824,7 +855,7 @@ class MusicPlayer {
                 </div>
                 <div class="download-info">
                     <h3>${song.title}</h3>
-                    <p>${song.uploader}</p>
+                    <p>${song.uploader}${song.duration ? ` · ${this.formatTime(song.duration)}` : ''}</p>
                 </div>
                 <div class="download-controls">
                     <button class="delete-btn" title="Delete">
@@ -1520,6 +1551,10 @@ class MusicPlayer {
             playlistWindow.innerHTML = `
                 <div class="playlist-window-header">
                     <h2>${playlist.name}</h2>
+                    <span class="playlist-download-status"></span>
+                    <button class="download-playlist" title="Download all">
+                        <i class="ri-download-line"></i>
+                    </button>
                     <button class="close-playlist">
                         <i class="ri-close-line"></i>
                     </button>
@@ -1558,6 +1593,9 @@ class MusicPlayer {
                 setTimeout(() => playlistWindow.remove(), 300);
             };
 
+            const downloadBtn = playlistWindow.querySelector('.download-playlist');
+            downloadBtn.onclick = () => this.downloadPlaylist(playlistId, playlistWindow);
+
             // Add play and remove handlers
             playlistWindow.querySelectorAll('.playlist-song-item').forEach(item => {
                 const songId = item.dataset.id;
@@ -1568,6 +1606,7 @@ class MusicPlayer {
                     this.isPlayingPlaylist = true;
                     this.upNextSection.classList.add('hidden');
                     this.queue = [...playlist.songs];
+                    this.resolveQueue(index + 1);
                     this.playTrack(index);
                 };
 
@@ -1655,6 +1694,45 @@ class MusicPlayer {
         }
     }
 
+    async downloadPlaylist(playlistId, playlistWindow) {
+        const statusText = playlistWindow.querySelector('.playlist-download-status');
+        const downloadBtn = playlistWindow.querySelector('.download-playlist');
+        try {
+            const response = await fetch(`/api/playlists/${playlistId}/download`, { method: 'POST' });
+            const result = await response.json();
+            if (!response.ok) throw new Error(result.error);
+
+            // Clicking again while running cancels the batch
+            downloadBtn.onclick = () => fetch(`/api/batches/${result.batch_id}/cancel`, { method: 'POST' });
+            downloadBtn.title = 'Cancel download';
+
+            const batch = result.batch;
+            const render = () => {
+                const finished = batch.skipped + batch.completed;
+                const failed = batch.failed ? `, ${batch.failed} failed` : '';
+                statusText.textContent = `${finished}/${batch.total} (${Math.round(batch.progress * 100)}%)${failed}`;
+            };
+            render();
+
+            const events = new EventSource(`/api/events?topic=batch:${result.batch_id}`);
+            const update = (event) => {
+                Object.assign(batch, JSON.parse(event.data));
+                render();
+                if (['done', 'cancelled'].includes(batch.status)) {
+                    events.close();
+                    statusText.textContent += batch.status === 'cancelled' ? ' cancelled' : '';
+                    downloadBtn.onclick = () => this.downloadPlaylist(playlistId, playlistWindow);
+                    downloadBtn.title = 'Download all';
+                    this.loadDownloadedSongs();
+                }
+            };
+            ['snapshot', 'update', 'done', 'cancelled'].forEach(name => events.addEventListener(name, update));
+        } catch (error) {
+            console.error('Playlist download failed:', error);
+            alert('Failed to download playlist');
+        }
+    }
+
     setupNavigation() {
         const navButtons = document.querySelectorAll('.nav-button');
         const sections = {